@@ -0,0 +1,85 @@
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger()
+
+Alert = namedtuple("Alert", ["symbol", "price", "threshold", "fired_at"])
+
+
+class AlertEngine:
+    """Evaluate price alerts for a whole portfolio in one vectorized pass.
+
+    A position alerts when its price is within ``tolerance`` of its alert threshold.
+    An alert fires once when a symbol enters that band (it is not repeated while the
+    price stays there) and at most once per ``min_interval`` per symbol. Fired alerts
+    are stored in the ``alerts`` table and handed to every registered sink; sinks
+    must not block.
+    """
+
+    def __init__(self, db, tolerance=0.05, min_interval=timedelta(hours=1)):
+        self.db = db
+        self.tolerance = tolerance
+        self.min_interval = min_interval
+        self.sinks = []
+        self.active = set()  # Symbols currently inside their alert band
+        self.last_fired = None  # symbol -> datetime, loaded lazily from the alerts table
+
+    def add_sink(self, sink):
+        """Register a callable that receives each list of newly fired alerts."""
+        self.sinks.append(sink)
+
+    def evaluate(self, frame):
+        """Check every position in an analytics.PortfolioFrame and fire new alerts."""
+        if self.last_fired is None:
+            self.last_fired = self._load_last_fired()
+        with np.errstate(invalid="ignore"):
+            near = (frame.valid & (np.nan_to_num(frame.alert_threshold) > 0)
+                    & (np.abs(frame.price - frame.alert_threshold) <= self.tolerance * frame.alert_threshold))
+        near_symbols = {frame.symbols[i] for i in np.flatnonzero(near)}
+        entered = near_symbols - self.active
+        self.active = near_symbols
+
+        now = datetime.now()
+        fired = []
+        for i in np.flatnonzero(near):
+            symbol = frame.symbols[i]
+            if symbol not in entered:
+                continue
+            last = self.last_fired.get(symbol)
+            if last is not None and now - last < self.min_interval:
+                continue
+            self.last_fired[symbol] = now
+            fired.append(Alert(symbol, float(frame.price[i]), float(frame.alert_threshold[i]), now))
+        if fired:
+            self._store(fired)
+            for sink in self.sinks:
+                sink(fired)
+        return fired
+
+    def recent(self, limit=50):
+        """Return the most recently fired alerts, newest first."""
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT symbol, price, threshold, fired_at FROM alerts ORDER BY fired_at DESC LIMIT ?", (limit,)).fetchall()
+        return [Alert(symbol, price, threshold, datetime.strptime(fired_at, "%Y-%m-%d %H:%M:%S"))
+                for symbol, price, threshold, fired_at in rows]
+
+    def _load_last_fired(self):
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT symbol, MAX(fired_at) FROM alerts GROUP BY symbol").fetchall()
+        return {symbol: datetime.strptime(fired_at, "%Y-%m-%d %H:%M:%S") for symbol, fired_at in rows}
+
+    def _store(self, fired):
+        with self.db.transaction() as conn:
+            conn.executemany("INSERT INTO alerts (symbol, price, threshold, fired_at) VALUES (?, ?, ?, ?)", [
+                (alert.symbol, alert.price, alert.threshold, alert.fired_at.strftime("%Y-%m-%d %H:%M:%S"))
+                for alert in fired
+            ])
+
+
+def log_sink(alerts):
+    """Alert sink that writes each alert to the log."""
+    for alert in alerts:
+        logger.warning("Price alert: %s price ($%.2f) is near alert threshold ($%.2f)", alert.symbol, alert.price, alert.threshold)
@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+import numpy as np
+
+PortfolioTotals = namedtuple("PortfolioTotals", ["count", "total_value", "total_gain_loss", "avg_margin"])
+
+
+def _column(values):
+    """Convert a sequence that may contain None into a float array with NaN for missing values."""
+    return np.array(values, dtype=float)
+
+
+class PortfolioFrame:
+    """Columnar portfolio positions with vectorized derived columns.
+
+    This is the single place where value, gain/loss and margin of safety are
+    computed. A position is valid when it has a non-zero price and share count and
+    a purchase price (which may be $0, e.g. shares received in a split); derived
+    columns are NaN for invalid positions. Margin of safety is 0 when there is no
+    positive intrinsic value.
+    """
+
+    def __init__(self, positions):
+        columns = list(zip(*positions)) if positions else [()] * 8
+        self.symbols = list(columns[0])
+        self.names = list(columns[1])
+        self.purchase_dates = list(columns[2])
+        self.purchase_price = _column(columns[3])
+        self.shares = _column(columns[4])
+        self.price = _column(columns[5])
+        self.intrinsic_value = _column(columns[6])
+        self.alert_threshold = _column(columns[7])
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.valid = (np.nan_to_num(self.price) != 0) & (np.nan_to_num(self.shares) != 0) & ~np.isnan(self.purchase_price)
+            self.value = np.where(self.valid, self.price * self.shares, np.nan)
+            self.gain_loss = np.where(self.valid, (self.price - self.purchase_price) * self.shares, np.nan)
+            has_intrinsic = (np.nan_to_num(self.intrinsic_value) > 0) & (np.nan_to_num(self.price) != 0)
+            margin = np.where(has_intrinsic, (self.intrinsic_value - self.price) / self.intrinsic_value * 100, 0.0)
+            self.margin = np.where(self.valid, margin, np.nan)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def totals(self):
+        """Return aggregates over valid positions."""
+        count = int(self.valid.sum())
+        if count == 0:
+            return PortfolioTotals(0, 0.0, 0.0, 0.0)
+        return PortfolioTotals(
+            count,
+            float(self.value[self.valid].sum()),
+            float(self.gain_loss[self.valid].sum()),
+            float(self.margin[self.valid].mean()),
+        )
+
+    def rows(self, valid_only=True):
+        """Yield (symbol, name, purchase_date, purchase_price, shares, price, value, gain_loss, intrinsic_value, margin, alert_threshold).
+
+        Missing numbers are returned as None and whole share counts as ints.
+        """
+        columns = [
+            self.symbols, self.names, self.purchase_dates,
+            _optional(self.purchase_price), _shares(self.shares), _optional(self.price), _optional(self.value),
+            _optional(self.gain_loss), _optional(self.intrinsic_value), _optional(self.margin), _optional(self.alert_threshold),
+        ]
+        valid = self.valid.tolist()
+        for is_valid, row in zip(valid, zip(*columns)):
+            if is_valid or not valid_only:
+                yield row
+
+
+def _optional(array):
+    return [None if value != value else value for value in array.tolist()]  # NaN != NaN
+
+
+def _shares(array):
+    return [None if value != value else int(value) if value.is_integer() else value for value in array.tolist()]
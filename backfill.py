@@ -0,0 +1,115 @@
+import logging
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+
+def share_steps(transactions):
+    """Return (dates, shares) after each of one symbol's date-sorted transactions.
+
+    Share counts are expressed in today's split terms, because downloaded closes
+    are split-adjusted: shares held before a split are scaled by every later ratio.
+    """
+    dates, held, splits = [], [], []
+    shares = 0.0
+    for transaction in transactions:
+        if transaction.kind == "buy":
+            shares += transaction.shares
+        elif transaction.kind == "sell":
+            shares = max(0.0, shares - transaction.shares)
+        elif transaction.kind == "split":
+            shares *= transaction.ratio
+            splits.append((transaction.trade_date, transaction.ratio))
+        else:
+            continue  # Dividends do not change the share count
+        dates.append(transaction.trade_date)
+        held.append(shares)
+    held = np.array(held, dtype=float)
+    for split_date, ratio in splits:
+        held[np.array(dates) < split_date] *= ratio
+    return np.array(dates), held
+
+
+class HistoryBackfill:
+    """Daily portfolio values reconstructed from the transaction log and stored closes.
+
+    ``run`` makes sure the price store covers every held symbol from its first
+    trade (the store downloads only missing ranges, in batched requests) and
+    writes one value per trading day into the daily and weekly history tiers.
+    The last day written and a version of the transaction log are kept in
+    ``history_backfill``: while the log is unchanged later runs only compute
+    and append the days since then; any new transaction triggers a rebuild from
+    the stored closes. Days before today only, since today's close is not final.
+    """
+
+    def __init__(self, db, prices, transactions, history, benchmarks=()):
+        self.db = db
+        self.prices = prices  # BenchmarkStore holding daily closes
+        self.benchmarks = list(benchmarks)  # Tickers kept covered alongside the holdings, for risk analytics
+        self.transactions = transactions
+        self.history = history
+        self.lock = threading.Lock()
+
+    @metrics.timed("history_backfill")
+    def run(self, today=None):
+        """Backfill daily values up to yesterday. Returns the number of days written."""
+        with self.lock:
+            today = today or date.today()
+            end = today.isoformat()
+            version = self.transactions.version()
+            through, stored_version = self._state()
+            incremental = through is not None and stored_version == version
+            if incremental and through >= (today - timedelta(days=1)).isoformat():
+                return 0
+            transactions = self.transactions.all()
+            if not transactions:
+                return 0
+            by_symbol = {}
+            for transaction in transactions:
+                by_symbol.setdefault(transaction.symbol, []).append(transaction)
+            first = transactions[0].trade_date
+            self.prices.update(sorted(set(by_symbol) | set(self.benchmarks)), date.fromisoformat(first), today)
+
+            start = through if incremental else first
+            closes = self.prices.closes(sorted(by_symbol), start, end)
+            days = np.unique(np.concatenate([dates for dates, _ in closes.values()] or [np.array([], dtype="U10")]))
+            days = days[(days > start) if incremental else (days >= start)]
+            if not len(days):
+                return 0
+            values = np.zeros(len(days))
+            for symbol, symbol_transactions in by_symbol.items():
+                step_dates, held = share_steps(symbol_transactions)
+                step = np.searchsorted(step_dates, days, side="right") - 1
+                shares = np.where(step >= 0, held[np.maximum(step, 0)], 0.0)
+                if symbol not in closes:
+                    if shares.any():
+                        logger.warning("No stored closes for %s, leaving it out of the backfilled history", symbol)
+                    continue
+                price_dates, prices = closes[symbol]
+                last = np.searchsorted(price_dates, days, side="right") - 1  # Carry the last close over missing days
+                values += shares * np.where(last >= 0, prices[np.maximum(last, 0)], 0.0)
+            rows = [(day, value) for day, value in zip(days.tolist(), values.tolist()) if value > 0]
+            self.history.record_daily(rows)
+            self._save_state(days[-1], version)
+            logger.info("Backfilled %s days of portfolio history %s", len(rows), "after " + start if incremental else "from " + start)
+            return len(rows)
+
+    def clear(self):
+        """Forget the backfill state, so the next run rebuilds everything."""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM history_backfill")
+
+    def _state(self):
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT through_date, transactions_version FROM history_backfill WHERE id = 1").fetchone()
+        return row or (None, None)
+
+    def _save_state(self, through, version):
+        with self.db.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO history_backfill (id, through_date, transactions_version) VALUES (1, ?, ?)",
+                         (str(through), version))
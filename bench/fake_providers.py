@@ -0,0 +1,202 @@
+"""Offline stand-ins for yfinance, FMP and FRED used by the benchmark suite.
+
+``FakeYFinance`` replaces the ``yfinance`` module (the app imports it lazily, so
+installing the fake in ``sys.modules`` before the first refresh is enough) and
+``ProviderStub`` serves FMP and FRED JSON from a local HTTP server that the
+engine reaches through FMP_BASE_URL/FRED_BASE_URL. Both derive their data from
+the symbol, so runs are reproducible, and both add configurable latency and
+error rates so slow or flaky providers can be replayed.
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from storage import Position
+
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1wk": 7, "1mo": 31, "3mo": 92, "1y": 366}
+
+
+def symbol_seed(symbol):
+    """Stable per-symbol seed, so every run sees the same synthetic data."""
+    return zlib.crc32(symbol.encode())
+
+
+def base_price(symbol):
+    return 10 + symbol_seed(symbol) % 49000 / 100
+
+
+def synthetic_positions(count, seed=0):
+    """Return count priced positions with distinct symbols and varied lots."""
+    rng = random.Random(seed)
+    start = date(2015, 1, 2)
+    positions = []
+    for i in range(count):
+        symbol = f"S{i:06d}"
+        price = base_price(symbol)
+        purchase_price = round(price * rng.uniform(0.5, 1.5), 2)
+        threshold = round(price * rng.uniform(0.9, 1.1), 2) if rng.random() < 0.2 else None
+        purchase_date = (start + timedelta(days=rng.randrange(3650))).isoformat()
+        positions.append(Position(symbol, f"{symbol} Corp", purchase_date, purchase_price, rng.randrange(1, 500),
+                                  price, round(price * rng.uniform(0.6, 1.6), 2), threshold))
+    return positions
+
+
+class FaultProfile:
+    """Latency and error injection shared by the fake providers."""
+
+    def __init__(self, latency=0.0, jitter=0.5, error_rate=0.0, seed=0):
+        self.latency = latency  # Mean seconds added to every call
+        self.jitter = jitter  # Latency varies uniformly by +/- this fraction
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+
+    def apply(self, endpoint):
+        """Sleep for one call's latency, then return True if the call should fail."""
+        with self.lock:
+            self.calls[endpoint] += 1
+            delay = self.latency * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors[endpoint] += 1
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors)}
+
+
+def _closes(symbol, start, end):
+    days = pd.bdate_range(start, end - timedelta(days=1))
+    rng = np.random.default_rng(symbol_seed(symbol))
+    walk = np.cumprod(1 + rng.normal(0.0003, 0.01, len(days)))
+    return pd.Series(base_price(symbol) * walk, index=days, name="Close")
+
+
+def _window(period=None, start=None, end=None):
+    end = pd.Timestamp(end).date() if end else date.today() + timedelta(days=1)
+    start = pd.Timestamp(start).date() if start else end - timedelta(days=PERIOD_DAYS.get(period, 31))
+    return start, end
+
+
+class FakeTicker:
+    def __init__(self, symbol, faults):
+        self.symbol = symbol
+        self.faults = faults
+
+    def history(self, period="1mo"):
+        if self.faults.apply("yf.history"):
+            raise ConnectionError(f"Injected yfinance history error for {self.symbol}")
+        return _closes(self.symbol, *_window(period)).to_frame()
+
+    @property
+    def info(self):
+        if self.faults.apply("yf.info"):
+            raise ConnectionError(f"Injected yfinance info error for {self.symbol}")
+        return {"longName": f"{self.symbol} Corp", "trailingEps": round(base_price(self.symbol) / 20, 2)}
+
+
+class FakeYFinance:
+    """Drop-in for the parts of the yfinance module the app uses: ``download`` and ``Ticker``."""
+
+    __name__ = "yfinance"
+
+    def __init__(self, faults):
+        self.faults = faults
+
+    def download(self, tickers, period=None, start=None, end=None, group_by="column", threads=True, progress=True):
+        if isinstance(tickers, str):
+            tickers = tickers.split()
+        if self.faults.apply("yf.download"):
+            raise ConnectionError(f"Injected yfinance download error for {len(tickers)} tickers")
+        window = _window(period, start, end)
+        frames = {ticker: _closes(ticker, *window).to_frame() for ticker in tickers}
+        return pd.concat(frames, axis=1)  # (ticker, field) columns, as with group_by="ticker"
+
+    def Ticker(self, symbol):
+        return FakeTicker(symbol, self.faults)
+
+
+class ProviderStub:
+    """Local HTTP server answering the FMP quote/income-statement and FRED observation endpoints.
+
+    ``fmp_base_url`` and ``fred_base_url`` are the values to put in FMP_BASE_URL and
+    FRED_BASE_URL. Injected errors answer 503.
+    """
+
+    def __init__(self, faults):
+        self.faults = faults
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real providers
+            disable_nagle_algorithm = True  # Headers and body are separate writes; avoid delayed-ACK stalls
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        host, port = self.server.server_address
+        self.fmp_base_url = f"http://{host}:{port}/fmp"
+        self.fred_base_url = f"http://{host}:{port}/fred"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def payload(self, path):
+        """Return the JSON body for a request path, or None if the path is unknown."""
+        parts = path.strip("/").split("/")
+        if parts[:2] == ["fred", "series"]:
+            return {"observations": [{"date": (date.today() - timedelta(days=1)).isoformat(), "value": "4.95"}]}
+        if parts[0] != "fmp" or len(parts) != 3:
+            return None
+        endpoint, symbol = parts[1], parts[2]
+        eps = round(base_price(symbol) / 20, 2)
+        if endpoint == "quote":
+            return [{"symbol": symbol, "name": f"{symbol} Corp", "price": base_price(symbol), "eps": eps}]
+        if endpoint == "income-statement":
+            growth = 1 + symbol_seed(symbol) % 15 / 100
+            year = date.today().year - 1
+            return [{"date": f"{year - i}-12-31", "fillingDate": f"{year - i + 1}-02-15", "eps": round(eps / growth ** i, 2)}
+                    for i in range(5)]
+        return None
+
+    def handle(self, request):
+        path = urlparse(request.path).path
+        endpoint = "/".join(path.strip("/").split("/")[:2])
+        if self.faults.apply(endpoint):
+            request.send_error(503, "Injected provider error")
+            return
+        payload = self.payload(path)
+        if payload is None:
+            request.send_error(404)
+            return
+        body = json.dumps(payload).encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
@@ -0,0 +1,119 @@
+"""Startup-time benchmark: module import time and time-to-first-paint of the GUI.
+
+Each measurement runs in a fresh interpreter with HOME pointed at a throwaway
+directory, so it sees a cold import cache and a seeded portfolio.db rather than
+the user's data, and with REFRESH_ON_START=False so nothing touches the network.
+Prints one JSON document and exits 1 if an import eagerly loads yfinance, pandas,
+matplotlib or openpyxl, or if a median exceeds --max-import-ms/--max-paint-ms,
+so it can guard against startup regressions in CI.
+
+    python bench/startup.py --runs 5 --positions 500 --max-import-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ["yfinance", "pandas", "matplotlib", "openpyxl"]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+PAINT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    print(json.dumps({"seconds": None, "error": str(e)}))
+    sys.exit(0)
+import portfolio_tracker
+app = portfolio_tracker.PortfolioTrackerApp(root)
+while len(app.tree.get_children()) < %(positions)d:
+    root.update()
+elapsed = time.perf_counter() - started
+app.on_close()
+print(json.dumps({"seconds": elapsed, "rows": %(positions)d}))
+"""
+
+
+def seed_portfolio(home, positions):
+    """Create HOME/PortfolioTracker/portfolio.db with the given number of synthetic priced positions."""
+    from storage import Database, Position, PositionRepository, Quote
+
+    data_dir = os.path.join(home, "PortfolioTracker")
+    os.makedirs(data_dir, exist_ok=True)
+    db = Database(os.path.join(data_dir, "portfolio.db"))
+    db.init_schema()
+    repo = PositionRepository(db)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    symbols = [f"SYM{i:05d}" for i in range(positions)]
+    repo.bulk_import([Position(symbol, None, "2020-01-02", 100.0, 10, None, None, None) for symbol in symbols], now)
+    repo.update_quotes([Quote(symbol, 110.0, f"{symbol} Inc", 5.0, 7.0, 120.0) for symbol in symbols], now)
+    db.close()
+
+
+def run_probe(code, home):
+    env = dict(os.environ, HOME=home, REFRESH_ON_START="False", PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True, timeout=300).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    milliseconds = [1000 * s for s in samples]
+    return {"runs": len(milliseconds), "median_ms": round(statistics.median(milliseconds), 1),
+            "min_ms": round(min(milliseconds), 1), "max_ms": round(max(milliseconds), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--positions", type=int, default=500, help="positions seeded into the portfolio for the paint probe")
+    parser.add_argument("--modules", nargs="+", default=["portfolio_tracker", "portfolio_cli"])
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time of any module exceeds this")
+    parser.add_argument("--max-paint-ms", type=float, help="fail if the median time-to-first-paint exceeds this")
+    args = parser.parse_args(argv)
+
+    report = {"python": sys.version.split()[0], "imports": {}, "first_paint": None}
+    failures = []
+    with tempfile.TemporaryDirectory() as home:
+        seed_portfolio(home, args.positions)
+        for module in args.modules:
+            probes = [run_probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES), home) for _ in range(args.runs)]
+            result = summarize([probe["seconds"] for probe in probes])
+            result["heavy_modules_loaded"] = probes[-1]["loaded"]
+            report["imports"][module] = result
+            if result["heavy_modules_loaded"]:
+                failures.append(f"import {module} loaded {', '.join(result['heavy_modules_loaded'])} eagerly")
+            if args.max_import_ms is not None and result["median_ms"] > args.max_import_ms:
+                failures.append(f"import {module}: {result['median_ms']}ms > {args.max_import_ms}ms")
+
+        probes = [run_probe(PAINT_PROBE % {"positions": args.positions}, home) for _ in range(args.runs)]
+        if probes[0]["seconds"] is None:
+            report["first_paint"] = {"skipped": probes[0]["error"]}  # No display available
+        else:
+            report["first_paint"] = dict(summarize([probe["seconds"] for probe in probes]), positions=args.positions)
+            if args.max_paint_ms is not None and report["first_paint"]["median_ms"] > args.max_paint_ms:
+                failures.append(f"first paint: {report['first_paint']['median_ms']}ms > {args.max_paint_ms}ms")
+
+    report["failures"] = failures
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Offline benchmark suite for the portfolio hot paths.
+
+Runs the engine against fake providers (see fake_providers.py) on synthetic
+portfolios and reports latency percentiles and throughput for each stage:
+
+    import_csv        bulk CSV import of every lot
+    load_portfolio    read positions, compute the frame and format treeview rows
+    fetch_stock_data  one cold per-symbol fetch (yfinance + FMP + FRED)
+    refresh_cold      a full refresh with an empty fundamentals cache
+    refresh_warm      the same refresh again, served mostly from caches
+    chart_data        downsampled history plus benchmark store update and reads
+    export            streaming .xlsx export
+
+Results are printed and saved as JSON under bench/results/, and --compare
+prints the p50 change against an earlier results file.
+
+    python bench/suite.py --sizes 10 1000 100000 --latency 0.02 --error-rate 0.01
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_providers import FakeYFinance, FaultProfile, ProviderStub, synthetic_positions  # noqa: E402
+from portfolio_engine import PortfolioEngine, configure_logging  # noqa: E402
+from portfolio_view import format_position_row  # noqa: E402
+from storage import Quote  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def summarize(latencies, items=None, elapsed=None):
+    """Percentiles (ms) of per-call latencies, with throughput if items and elapsed are given."""
+    ms = np.asarray(latencies, dtype=float) * 1000
+    result = {"count": len(ms)}
+    if len(ms):
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        result.update(p50_ms=round(p50, 2), p90_ms=round(p90, 2), p99_ms=round(p99, 2),
+                      max_ms=round(ms.max(), 2), mean_ms=round(ms.mean(), 2))
+    if items is not None and elapsed:
+        result["items_per_s"] = round(items / elapsed, 1)
+    return result
+
+
+def timed(func, repeat):
+    """Call func repeat times and return (per-call latencies, last result)."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        latencies.append(time.perf_counter() - started)
+    return latencies, result
+
+
+def write_csv(path, positions):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["symbol", "shares", "purchase_date", "purchase_price", "alert_threshold"])
+        writer.writerows((p.symbol, p.shares, p.purchase_date, p.purchase_price, p.alert_threshold or "") for p in positions)
+
+
+def seed_history(engine, days):
+    """Record one synthetic portfolio value per day for the given number of past days."""
+    rng = np.random.default_rng(0)
+    values = 100000 * np.cumprod(1 + rng.normal(0.0003, 0.01, days))
+    today = datetime.now().replace(hour=16, minute=0, second=0, microsecond=0)
+    for i, value in enumerate(values):
+        engine.history.record(today - timedelta(days=days - i), float(value))
+
+
+def run_refresh(engine, symbols):
+    """Refresh symbols, returning (per-symbol completion times, failures, elapsed seconds)."""
+    started = time.perf_counter()
+    completions, results, failed = [], {}, 0
+    engine.refresh_engine.start(symbols)
+    while True:
+        kind, symbol, data = engine.refresh_engine.results.get()
+        if kind == "done":
+            break
+        completions.append(time.perf_counter() - started)
+        if kind == "result":
+            results[symbol] = data
+        else:
+            failed += 1
+    engine.apply_refresh(results)
+    return completions, failed, time.perf_counter() - started
+
+
+def bench_size(size, args, work_dir):
+    data_dir = os.path.join(work_dir, f"size-{size}")
+    os.makedirs(data_dir)
+    engine = PortfolioEngine(data_dir)
+    positions = synthetic_positions(size, seed=args.seed)
+    symbols = [p.symbol for p in positions]
+    stages = {}
+    try:
+        csv_path = os.path.join(data_dir, "positions.csv")
+        write_csv(csv_path, positions)
+        latencies, _ = timed(lambda: engine.import_csv(csv_path), 1)
+        stages["import_csv"] = summarize(latencies, size, sum(latencies))
+        engine.positions.update_quotes([Quote(p.symbol, p.price, p.company_name, 1.0, 0.05, p.intrinsic_value) for p in positions],
+                                       datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+        def load():
+            frame = engine.load_snapshot()
+            return [format_position_row(*row) for row in frame.rows()]
+        latencies, _ = timed(load, args.repeat)
+        stages["load_portfolio"] = summarize(latencies, size * args.repeat, sum(latencies))
+
+        sample = symbols[:args.fetch_sample]
+        latencies = []
+        for symbol in sample:
+            started = time.perf_counter()
+            engine.fetch_stock_data(symbol)
+            latencies.append(time.perf_counter() - started)
+        stages["fetch_stock_data"] = summarize(latencies, len(sample), sum(latencies))
+
+        refresh_symbols = symbols[:args.max_refresh]
+        with engine.db.transaction() as conn:
+            conn.execute("DELETE FROM fundamentals_cache")
+        for stage in ("refresh_cold", "refresh_warm"):
+            completions, failed, elapsed = run_refresh(engine, refresh_symbols)
+            stages[stage] = dict(summarize(completions, len(refresh_symbols), elapsed), failed=failed)
+
+        seed_history(engine, args.history_days)
+
+        def chart_data():
+            rows = engine.history.series(max_points=800)
+            start = datetime.strptime(rows[0][0], "%Y-%m-%d")
+            end = datetime.strptime(rows[-1][0], "%Y-%m-%d") + timedelta(days=1)
+            engine.benchmark_store.update(["^GSPC", "^NYA", "^IXIC"], start, end)
+            return [engine.benchmark_store.series(ticker, start, end) for ticker in ("^GSPC", "^NYA", "^IXIC")]
+        latencies, _ = timed(chart_data, args.repeat)
+        stages["chart_data"] = summarize(latencies)
+
+        export_path = os.path.join(data_dir, "export.xlsx")
+        latencies, _ = timed(lambda: engine.export(export_path), args.export_repeat)
+        stages["export"] = summarize(latencies, (size + args.history_days) * args.export_repeat, sum(latencies))
+    finally:
+        engine.close()
+    return stages
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report, baseline_path):
+    """Print the p50 change per stage against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange in p50 vs {baseline_path} ({baseline.get('revision')}):")
+    for size, stages in report["results"].items():
+        for stage, result in stages.items():
+            before = baseline["results"].get(size, {}).get(stage, {}).get("p50_ms")
+            if before and result.get("p50_ms") is not None:
+                print(f"  {size:>7} {stage:<17} {before:>10.2f} -> {result['p50_ms']:>10.2f} ms ({result['p50_ms'] / before - 1:+.0%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the portfolio hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000], help="portfolio sizes in lots")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean provider latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency varies by +/- this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of provider calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of the load and chart stages")
+    parser.add_argument("--export-repeat", type=int, default=1)
+    parser.add_argument("--fetch-sample", type=int, default=50, help="symbols timed individually by fetch_stock_data")
+    parser.add_argument("--max-refresh", type=int, default=1000, help="cap on symbols per refresh run")
+    parser.add_argument("--history-days", type=int, default=1825)
+    parser.add_argument("--fmp-rate", type=float, default=1e6, help="FMP requests per second (the app uses 5)")
+    parser.add_argument("--output", help="results file (default: bench/results/suite-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare p50 latencies against")
+    args = parser.parse_args(argv)
+
+    faults = FaultProfile(args.latency, args.jitter, args.error_rate, args.seed)
+    sys.modules["yfinance"] = FakeYFinance(faults)
+    report = {"revision": git_revision(), "started_at": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "args": vars(args), "results": {}}
+    with tempfile.TemporaryDirectory() as work_dir, ProviderStub(faults) as stub:
+        os.environ.update(FMP_BASE_URL=stub.fmp_base_url, FRED_BASE_URL=stub.fred_base_url,
+                          FMP_API_KEY="bench", FRED_API_KEY="bench", FMP_RATE_LIMIT=str(args.fmp_rate))
+        configure_logging(work_dir)
+        for size in args.sizes:
+            print(f"Benchmarking {size} lots...", file=sys.stderr)
+            report["results"][str(size)] = bench_size(size, args, work_dir)
+    report["providers"] = faults.stats()
+
+    for size, stages in report["results"].items():
+        print(f"\n{size} lots")
+        for stage, result in stages.items():
+            throughput = f"{result['items_per_s']:>10.1f}/s" if "items_per_s" in result else ""
+            print(f"  {stage:<17} p50 {result.get('p50_ms', 0):>9.2f}  p90 {result.get('p90_ms', 0):>9.2f}  "
+                  f"p99 {result.get('p99_ms', 0):>9.2f} ms {throughput}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"suite-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {output}")
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
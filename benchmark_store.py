@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+BENCHMARKS = {
+    "S&P 500": "^GSPC",
+    "NYSE Composite": "^NYA",
+    "NASDAQ Composite": "^IXIC"
+}
+
+
+def last_close_date(today=None):
+    """Return the latest weekday before today, the last session whose close is final (holidays not included)."""
+    day = (today or datetime.now().date()) - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+class BenchmarkStore:
+    """Local store of daily closes, for benchmarks and held symbols, that only downloads what it is missing.
+
+    Closes live in ``benchmark_prices`` and the date range already requested for
+    each ticker in ``benchmark_coverage``. ``update`` fetches only the head and tail
+    outside that range, in batched downloads of many tickers each, and re-checks the
+    current day at most once per ``recheck_after`` seconds. Reads never touch the
+    network, so charts render offline from whatever is stored.
+    """
+
+    CHUNK = 400  # Tickers per query, under SQLite's bound-parameter limit
+
+    def __init__(self, db, recheck_after=3600, download_chunk=100):
+        self.db = db
+        self.recheck_after = recheck_after
+        self.download_chunk = download_chunk
+        self.checked_at = {}  # ticker -> monotonic time of the last tail download
+        self.lock = threading.Lock()
+
+    @metrics.timed("benchmark_update")
+    def update(self, tickers, start_date, end_date):
+        """Make sure closes for tickers cover [start_date, end_date), downloading only the gaps."""
+        with self.lock:
+            start = start_date.strftime("%Y-%m-%d")
+            end = end_date.strftime("%Y-%m-%d")
+            covered_end = min(end, datetime.now().strftime("%Y-%m-%d"))  # Today's close is not final, keep it uncovered
+            coverage = self._coverage(tickers)
+            now = time.monotonic()
+
+            missing = [t for t in tickers if t not in coverage]
+            if missing:
+                self._download(missing, start, end, {t: (start, covered_end) for t in missing}, coverage)
+                self.checked_at.update({t: now for t in missing})
+            head = [t for t in tickers if t in coverage and start < coverage[t][0]]
+            if head:
+                self._download(head, start, min(coverage[t][0] for t in head), {t: (start, coverage[t][1]) for t in head}, coverage)
+            tail = [t for t in tickers if t in coverage and coverage[t][1] < end
+                    and now - self.checked_at.get(t, float("-inf")) >= self.recheck_after]
+            if tail:
+                self._download(tail, min(coverage[t][1] for t in tail), end, {t: (coverage[t][0], covered_end) for t in tail}, coverage)
+                self.checked_at.update({t: now for t in tail})
+
+    def series(self, ticker, start_date=None, end_date=None):
+        """Return (dates, closes) for ticker from the local store."""
+        query = "SELECT date, close FROM benchmark_prices WHERE ticker = ?"
+        params = [ticker]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date:
+            query += " AND date < ?"
+            params.append(end_date.strftime("%Y-%m-%d"))
+        with self.db.connection() as conn:
+            rows = conn.execute(query + " ORDER BY date", params).fetchall()
+        if not rows:
+            return [], np.array([])
+        dates, closes = zip(*rows)
+        return list(dates), np.array(closes, dtype=float)
+
+    def version(self, tickers):
+        """Return a token that changes whenever closes for tickers are added."""
+        with self.db.connection() as conn:
+            return conn.execute(
+                f"SELECT COUNT(*), MAX(date) FROM benchmark_prices WHERE ticker IN ({','.join('?' * len(tickers))})", tickers).fetchone()
+
+    def closes(self, tickers, start, end):
+        """Return {ticker: (dates, closes)} as arrays for start <= date < end (ISO strings).
+
+        Each series also starts with the ticker's last close before start, if any,
+        so callers can carry it forward into the range.
+        """
+        series = {}
+        with self.db.connection() as conn:
+            for i in range(0, len(tickers), self.CHUNK):
+                chunk = list(tickers[i:i + self.CHUNK])
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(f"""
+                    SELECT ticker, date, close FROM benchmark_prices WHERE ticker IN ({marks}) AND date >= ? AND date < ?
+                    UNION ALL
+                    SELECT ticker, MAX(date), close FROM benchmark_prices WHERE ticker IN ({marks}) AND date < ? GROUP BY ticker
+                    ORDER BY ticker, date
+                """, chunk + [start, end] + chunk + [start]).fetchall()
+                for ticker, date, close in rows:
+                    series.setdefault(ticker, ([], []))
+                    series[ticker][0].append(date)
+                    series[ticker][1].append(close)
+        return {ticker: (np.array(dates), np.array(closes, dtype=float)) for ticker, (dates, closes) in series.items()}
+
+    def _coverage(self, tickers):
+        coverage = {}
+        with self.db.connection() as conn:
+            for i in range(0, len(tickers), self.CHUNK):
+                chunk = list(tickers[i:i + self.CHUNK])
+                rows = conn.execute(
+                    f"SELECT ticker, start_date, end_date FROM benchmark_coverage WHERE ticker IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                coverage.update({ticker: (start, end) for ticker, start, end in rows})
+        return coverage
+
+    def _download(self, tickers, start, end, new_coverage, coverage):
+        """Download closes for tickers in batches of download_chunk and store them with their new coverage."""
+        if start >= end:
+            return
+        for i in range(0, len(tickers), self.download_chunk):
+            chunk = tickers[i:i + self.download_chunk]
+            self._download_batch(chunk, start, end, {t: new_coverage[t] for t in chunk}, coverage)
+
+    def _download_batch(self, tickers, start, end, new_coverage, coverage):
+        metrics.increment("provider_calls", provider="yfinance", capability="benchmark_closes")
+        import yfinance as yf
+        try:
+            data = yf.download(tickers, start=start, end=end, group_by="ticker", progress=False)
+        except Exception as e:
+            logger.error("Error fetching benchmark data for %s: %s", tickers, e)
+            return
+        rows, returned = [], set()
+        for ticker in tickers:
+            try:
+                closes = (data[ticker]["Close"] if data.columns.nlevels > 1 else data["Close"]).dropna()
+            except KeyError:
+                closes = []
+            if not len(closes):
+                logger.warning("No benchmark data returned for %s", ticker)
+                continue
+            returned.add(ticker)
+            rows.extend(zip([ticker] * len(closes), closes.index.strftime("%Y-%m-%d"), closes.astype(float).tolist()))
+        if not rows:
+            logger.warning("No benchmark data returned for %s from %s to %s", tickers, start, end)  # Offline or a market holiday
+            return
+        with self.db.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO benchmark_prices (ticker, date, close) VALUES (?, ?, ?)", rows)
+            for ticker, (cov_start, cov_end) in new_coverage.items():
+                if ticker not in returned:
+                    continue  # Leave it uncovered so the next update downloads it again
+                if ticker in coverage:
+                    cov_start = min(cov_start, coverage[ticker][0])
+                    cov_end = max(cov_end, coverage[ticker][1])
+                conn.execute("INSERT OR REPLACE INTO benchmark_coverage (ticker, start_date, end_date) VALUES (?, ?, ?)",
+                             (ticker, cov_start, cov_end))
+        logger.info("Stored %s benchmark closes for %s from %s to %s", len(rows), tickers, start, end)
@@ -0,0 +1,88 @@
+import logging
+
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+THEMES = {
+    False: {
+        "colors": ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728'],
+        "text": 'black',
+        "grid": 'gray',
+        "background": '#f0f0f0',
+    },
+    True: {
+        "colors": ['#64B5F6', '#ffaa00', '#66cc66', '#ff6666'],
+        "text": 'white',
+        "grid": 'lightgray',
+        "background": '#333333',
+    },
+}
+
+
+class PortfolioChart:
+    """Persistent portfolio-vs-benchmarks chart embedded in a Tk frame.
+
+    The Figure, Axes, Line2D artists and Tk canvas are created once. New data is
+    applied with ``set_data`` and theme changes by updating artist properties, and
+    both only schedule a ``draw_idle``, so neither rebuilds widgets nor leaks
+    figures. The first series is the portfolio; the others are benchmarks.
+    """
+
+    def __init__(self, master, series_names, dark_mode=False):
+        self.figure = Figure(figsize=(10, 6))  # Not registered with pyplot, so nothing to close
+        self.ax = self.figure.add_subplot()
+        self.lines = {}
+        for i, name in enumerate(series_names):
+            self.lines[name], = self.ax.plot([], [], marker='o' if i == 0 else 's', label=name)
+        self.ax.xaxis_date()
+        self.ax.set_title("Portfolio vs Benchmarks (Normalized)", fontsize=14)
+        self.ax.set_xlabel("Date", fontsize=12)
+        self.ax.set_ylabel("Normalized Value (Base 100)", fontsize=12)
+        self.ax.tick_params(axis='x', rotation=45)
+        self.ax.grid(True, linestyle='--', alpha=0.7)
+        self.legend = self.ax.legend()
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        self.apply_theme(dark_mode)
+
+    @metrics.timed("chart_render")
+    def set_data(self, series):
+        """Plot series (name -> (dates, values)), each normalized to start at 100."""
+        for name, line in self.lines.items():
+            dates, values = series.get(name, ([], []))
+            values = np.asarray(values, dtype=float)
+            if len(values) == 0 or not values[0]:
+                line.set_data([], [])
+                line.set_visible(False)
+                continue
+            x = mdates.date2num(np.array(dates, dtype="datetime64[D]"))
+            line.set_data(x, 100 * values / values[0])
+            line.set_visible(True)
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        self.figure.tight_layout()
+        self.canvas.draw_idle()
+        logger.info("Updated portfolio vs benchmarks chart data")
+
+    def apply_theme(self, dark_mode):
+        """Recolor the existing artists for the light or dark theme."""
+        theme = THEMES[dark_mode]
+        for line, color in zip(self.lines.values(), theme["colors"]):
+            line.set_color(color)
+        for handle, color in zip(self.legend.legend_handles, theme["colors"]):
+            handle.set_color(color)
+        for text in (self.ax.title, self.ax.xaxis.label, self.ax.yaxis.label):
+            text.set_color(theme["text"])
+        self.ax.tick_params(axis='both', colors=theme["text"])
+        self.ax.grid(True, linestyle='--', alpha=0.7, color=theme["grid"])
+        self.ax.set_facecolor(theme["background"])
+        self.figure.set_facecolor(theme["background"])
+        self.canvas.get_tk_widget().configure(bg=theme["background"])
+        self.canvas.draw_idle()
@@ -0,0 +1,213 @@
+import csv
+import logging
+import threading
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import LineChart, Reference
+from openpyxl.styles import Alignment, Color, Font, NamedStyle, PatternFill
+
+from analytics import PortfolioFrame
+from instrumentation import metrics
+from storage import PositionRepository
+
+logger = logging.getLogger()
+
+POSITION_HEADERS = ["Symbol", "Company Name", "Purchase Date", "Purchase Price ($)", "Shares", "Current Price ($)", "Total Value ($)", "Gain/Loss ($)", "Intrinsic Value ($)", "Margin of Safety (%)", "Alert Threshold ($)"]
+HISTORY_HEADERS = ["Date", "Total Value ($)"]
+HISTORY_QUERY = "SELECT date, total_value FROM portfolio_history ORDER BY date"
+
+
+def _named_styles():
+    """Shared named styles, so styled cells reference one style record instead of per-cell objects."""
+    currency = NamedStyle(name="currency", number_format="$#,##0.00")
+    gain = NamedStyle(name="gain", number_format="$#,##0.00",
+                      fill=PatternFill(start_color=Color(rgb="90EE90"), end_color=Color(rgb="90EE90"), fill_type="solid"))
+    loss = NamedStyle(name="loss", number_format="$#,##0.00",
+                      fill=PatternFill(start_color=Color(rgb="FFB6C1"), end_color=Color(rgb="FFB6C1"), fill_type="solid"))
+    percent = NamedStyle(name="percent", number_format="0.0%")
+    header = NamedStyle(name="header", font=Font(bold=True), alignment=Alignment(horizontal="center"))
+    return [currency, gain, loss, percent, header]
+
+
+def _cell(sheet, value, style):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.style = style
+    return cell
+
+
+def _count(db, query):
+    with db.connection() as conn:
+        return conn.execute(query).fetchone()[0]
+
+
+def _risk_sheet(wb, report):
+    """Add a sheet with the risk metrics, benchmark betas and rolling volatility of a risk.RiskReport."""
+    sheet = wb.create_sheet("Risk")
+    sheet.append([_cell(sheet, "Metric", "header"), _cell(sheet, "Value", "header")])
+    for label, value, style in (
+        ("Period", f"{report.start} to {report.end}", None),
+        ("Trading Days", report.days, None),
+        ("Time-Weighted Return", report.twr, "percent"),
+        ("Annualized Return", report.annualized_return, "percent"),
+        ("Max Drawdown", report.max_drawdown, "percent"),
+        ("Drawdown Peak", report.drawdown_peak, None),
+        ("Drawdown Trough", report.drawdown_trough, None),
+        (f"Volatility ({report.window}-day, annualized)", report.volatility, "percent"),
+        ("Sharpe Ratio", round(report.sharpe, 2) if report.sharpe is not None else None, None),
+        ("Risk-Free Rate", report.risk_free_rate, "percent"),
+    ):
+        value = value if value is not None else "N/A"
+        sheet.append([label, _cell(sheet, value, style) if style else value])
+    sheet.append([])
+    sheet.append([_cell(sheet, header, "header") for header in ("Benchmark", "Ticker", "Beta", "Correlation", "Days")])
+    for name, risk in report.benchmarks.items():
+        sheet.append([name, risk.ticker, risk.beta, risk.correlation, risk.days])
+    sheet.append([])
+    sheet.append([_cell(sheet, header, "header") for header in ("Date", "Rolling Volatility")])
+    for date, volatility in zip(*report.rolling_volatility):
+        sheet.append([date, _cell(sheet, volatility, "percent")])
+
+
+@metrics.timed("export", format="xlsx")
+def export_excel(db, path, progress=None, chunk_size=5000, risk_report=None):
+    """Stream positions and history from SQLite into a write-only workbook at path.
+
+    progress, if given, is called with (rows_written, total_rows) after each chunk.
+    Memory stays bounded by chunk_size regardless of how long the history is.
+    risk_report, a risk.RiskReport, is written to a Risk sheet when given.
+    """
+    total = _count(db, "SELECT COUNT(*) FROM portfolio") + _count(db, "SELECT COUNT(*) FROM portfolio_history")
+    written = 0
+    wb = openpyxl.Workbook(write_only=True)
+    for style in _named_styles():
+        wb.add_named_style(style)
+
+    sheet = wb.create_sheet("Portfolio Summary")
+    sheet.append([_cell(sheet, header, "header") for header in POSITION_HEADERS])
+    with db.connection() as conn:
+        cursor = conn.execute(PositionRepository.SELECT_ALL)
+        for chunk in iter(lambda: cursor.fetchmany(chunk_size), []):
+            for symbol, name, purchase_date, purchase_price, shares, price, value, gain_loss, intrinsic_value, margin, alert_threshold in PortfolioFrame(chunk).rows(valid_only=False):
+                sheet.append([
+                    symbol, name or "N/A", purchase_date or "N/A",
+                    _cell(sheet, purchase_price, "currency"), shares, _cell(sheet, price, "currency"),
+                    _cell(sheet, value if value is not None else "N/A", "currency"),
+                    _cell(sheet, gain_loss if gain_loss is not None else "N/A",
+                          "gain" if gain_loss and gain_loss > 0 else "loss" if gain_loss and gain_loss < 0 else "currency"),
+                    _cell(sheet, intrinsic_value if intrinsic_value else "N/A", "currency"),
+                    _cell(sheet, margin / 100 if margin else "N/A", "percent"),
+                    _cell(sheet, alert_threshold if alert_threshold else "N/A", "currency"),
+                ])
+            written += len(chunk)
+            if progress:
+                progress(written, total)
+
+    history_sheet = wb.create_sheet("Portfolio History")
+    history_sheet.append(HISTORY_HEADERS)
+    history_count = 0
+    with db.connection() as conn:
+        cursor = conn.execute(HISTORY_QUERY)
+        for chunk in iter(lambda: cursor.fetchmany(chunk_size), []):
+            for date, value in chunk:
+                history_sheet.append([date, _cell(history_sheet, value, "currency")])
+            history_count += len(chunk)
+            written += len(chunk)
+            if progress:
+                progress(written, total)
+
+    # Add chart to history sheet
+    chart = LineChart()
+    chart.title = "Portfolio Value Over Time"
+    chart.x_axis.title = "Date"
+    chart.y_axis.title = "Value ($)"
+    data = Reference(history_sheet, min_col=2, min_row=1, max_row=history_count + 1)
+    dates = Reference(history_sheet, min_col=1, min_row=2, max_row=history_count + 1)
+    chart.add_data(data, titles_from_data=True)
+    chart.set_categories(dates)
+    history_sheet.add_chart(chart, "D2")
+
+    if risk_report is not None:
+        _risk_sheet(wb, risk_report)
+    wb.save(path)
+    logger.info("Exported %s rows to %s", written, path)
+    return written
+
+
+@metrics.timed("export", format="csv")
+def export_history_csv(db, path, progress=None, chunk_size=50000):
+    """Stream portfolio history to a CSV file."""
+    total = _count(db, "SELECT COUNT(*) FROM portfolio_history")
+    written = 0
+    with open(path, "w", newline="") as f, db.connection() as conn:
+        writer = csv.writer(f)
+        writer.writerow(HISTORY_HEADERS)
+        cursor = conn.execute(HISTORY_QUERY)
+        for chunk in iter(lambda: cursor.fetchmany(chunk_size), []):
+            writer.writerows(chunk)
+            written += len(chunk)
+            if progress:
+                progress(written, total)
+    logger.info("Exported %s history rows to %s", written, path)
+    return written
+
+
+@metrics.timed("export", format="parquet")
+def export_history_parquet(db, path, progress=None, chunk_size=50000):
+    """Stream portfolio history to a Parquet file (requires pyarrow)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+    schema = pa.schema([("date", pa.string()), ("total_value", pa.float64())])
+    total = _count(db, "SELECT COUNT(*) FROM portfolio_history")
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer, db.connection() as conn:
+        cursor = conn.execute(HISTORY_QUERY)
+        for chunk in iter(lambda: cursor.fetchmany(chunk_size), []):
+            dates, values = zip(*chunk)
+            writer.write_table(pa.table({"date": list(dates), "total_value": list(values)}, schema=schema))
+            written += len(chunk)
+            if progress:
+                progress(written, total)
+    logger.info("Exported %s history rows to %s", written, path)
+    return written
+
+
+EXPORTERS = {
+    ".xlsx": export_excel,
+    ".csv": export_history_csv,
+    ".parquet": export_history_parquet,
+}
+
+
+class ExportJob:
+    """Run an exporter on a background thread and expose its progress for polling."""
+
+    def __init__(self, exporter, db, path, **options):
+        self.exporter = exporter
+        self.db = db
+        self.path = path
+        self.options = options  # Extra keyword arguments for the exporter
+        self.progress = (0, 0)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start the export."""
+        self.thread.start()
+
+    def is_running(self):
+        """Return True until the export finishes or fails."""
+        return self.thread.is_alive()
+
+    def _run(self):
+        try:
+            self.exporter(self.db, self.path, progress=self._report, **self.options)
+        except Exception as e:
+            logger.error("Export to %s failed: %s", self.path, e)
+            self.error = e
+
+    def _report(self, done, total):
+        self.progress = (done, total)
@@ -0,0 +1,127 @@
+import json
+import logging
+from datetime import datetime, timedelta
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+# Time-to-live per data class
+PRICE_TTL = timedelta(minutes=5)
+QUOTE_TTL = timedelta(days=1)  # EPS TTM moves at most once per quarterly report
+INFO_TTL = timedelta(days=1)
+MIN_TTL = timedelta(days=1)  # Floor for filing-based expiry once a filing is overdue
+
+
+def next_filing_expiry(income_data):
+    """Expire annual income statements when the next annual filing is expected."""
+    now = datetime.now()
+    if not income_data:
+        return now + MIN_TTL
+    latest = income_data[0]
+    try:
+        if latest.get("fillingDate"):
+            expected = datetime.strptime(latest["fillingDate"][:10], "%Y-%m-%d") + timedelta(days=365)
+        else:
+            expected = datetime.strptime(latest["date"][:10], "%Y-%m-%d") + timedelta(days=365 + 90)
+    except (KeyError, TypeError, ValueError):
+        return now + MIN_TTL
+    return max(expected, now + MIN_TTL)
+
+
+class FundamentalsCache:
+    """On-disk cache of provider responses keyed by symbol and endpoint.
+
+    Entries live in the ``fundamentals_cache`` table with an expiry chosen per data
+    class. Expired entries are re-validated with ``If-None-Match`` /
+    ``If-Modified-Since`` when the provider supplied validators, and served stale if
+    the provider cannot be reached.
+    """
+
+    def __init__(self, db, transport):
+        self.db = db
+        self.transport = transport  # http_transport.HttpTransport
+
+    def get(self, symbol, endpoint):
+        """Return (payload, expires_at, etag, last_modified) for a cached entry, or None."""
+        with self.db.connection() as conn:
+            row = conn.execute("""
+                SELECT payload, expires_at, etag, last_modified FROM fundamentals_cache
+                WHERE symbol = ? AND endpoint = ?
+            """, (symbol, endpoint)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S"), row[2], row[3]
+
+    def get_fresh(self, symbol, endpoint):
+        """Return the cached payload if it has not expired, else None."""
+        entry = self.get(symbol, endpoint)
+        if entry and datetime.now() < entry[1]:
+            metrics.increment("cache_requests", cache="fundamentals", endpoint=endpoint, result="hit")
+            return entry[0]
+        metrics.increment("cache_requests", cache="fundamentals", endpoint=endpoint, result="miss")
+        return None
+
+    def put(self, symbol, endpoint, payload, expires_at, etag=None, last_modified=None):
+        """Store a payload with its expiry and optional HTTP validators."""
+        with self.db.transaction() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO fundamentals_cache (symbol, endpoint, payload, fetched_at, expires_at, etag, last_modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (symbol, endpoint, json.dumps(payload), datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                  expires_at.strftime("%Y-%m-%d %H:%M:%S"), etag, last_modified))
+
+    def touch(self, symbol, endpoint, expires_at):
+        """Extend the expiry of an entry the provider confirmed as unchanged."""
+        with self.db.transaction() as conn:
+            conn.execute("""
+                UPDATE fundamentals_cache SET fetched_at = ?, expires_at = ?
+                WHERE symbol = ? AND endpoint = ?
+            """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), expires_at.strftime("%Y-%m-%d %H:%M:%S"), symbol, endpoint))
+
+    def get_json(self, symbol, endpoint, url, ttl, before_request=None):
+        """Return the JSON payload for url, using the cache and conditional requests.
+
+        ttl is either a timedelta or a callable mapping the payload to its expiry.
+        before_request, if given, is called right before any network request (e.g. a
+        rate limiter).
+        """
+        entry = self.get(symbol, endpoint)
+        now = datetime.now()
+        if entry and now < entry[1]:
+            metrics.increment("cache_requests", cache="fundamentals", endpoint=endpoint, result="hit")
+            logger.debug("Cache hit for %s %s", symbol, endpoint)
+            return entry[0]
+
+        headers = {}
+        if entry and entry[2]:
+            headers["If-None-Match"] = entry[2]
+        if entry and entry[3]:
+            headers["If-Modified-Since"] = entry[3]
+        try:
+            if before_request:
+                before_request()
+            response = self.transport.get(url, headers=headers, endpoint=endpoint)
+            if response.status_code == 304 and entry:
+                payload = entry[0]
+                self.touch(symbol, endpoint, self._expires_at(ttl, payload))
+                metrics.increment("cache_requests", cache="fundamentals", endpoint=endpoint, result="revalidated")
+                logger.debug("Cache revalidated for %s %s", symbol, endpoint)
+                return payload
+            response.raise_for_status()
+            payload = response.json()
+        except Exception as e:
+            if entry:
+                metrics.increment("cache_requests", cache="fundamentals", endpoint=endpoint, result="stale")
+                logger.warning("Serving stale %s for %s: %s", endpoint, symbol, e)
+                return entry[0]
+            raise
+        metrics.increment("cache_requests", cache="fundamentals", endpoint=endpoint, result="miss")
+        self.put(symbol, endpoint, payload, self._expires_at(ttl, payload),
+                 response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return payload
+
+    def _expires_at(self, ttl, payload):
+        if callable(ttl):
+            return ttl(payload)
+        return datetime.now() + ttl
@@ -0,0 +1,107 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class EndpointStats:
+    """Request count, errors, retries and latency for one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.statuses = {}
+
+    def snapshot(self):
+        return {
+            "requests": self.requests, "errors": self.errors, "retries": self.retries,
+            "avg_latency": self.total_latency / self.requests if self.requests else None,
+            "max_latency": self.max_latency, "statuses": dict(self.statuses),
+        }
+
+
+class HttpTransport:
+    """Shared HTTP client for every provider call.
+
+    One pooled ``requests.Session`` keeps connections alive across a refresh, so
+    only the first request to a host pays for the TCP and TLS handshake, and
+    ``pool_maxsize`` caps the connections held per host. Every request gets
+    connect/read timeouts, and 429/5xx responses and connection errors are retried
+    with jittered exponential backoff, honouring ``Retry-After``. Latency, errors
+    and status codes are recorded per endpoint label.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=15.0, retries=3, base_delay=0.5, max_delay=8.0,
+                 pool_connections=4, pool_maxsize=8):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, endpoint=None):
+        """GET url and return the final response; raises requests exceptions once retries run out.
+
+        endpoint labels the request in the metrics (default: host and path).
+        Non-retryable error statuses are returned for the caller to handle.
+        """
+        if endpoint is None:
+            parsed = urlparse(url)
+            endpoint = parsed.netloc + parsed.path
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(endpoint, time.monotonic() - started, None, attempt)
+                if attempt == self.retries:
+                    raise
+                logger.warning("%s request failed (%s), retrying", endpoint, type(e).__name__)
+                time.sleep(self._delay(attempt))
+                continue
+            self._record(endpoint, time.monotonic() - started, response.status_code, attempt)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            logger.warning("%s returned %s, retrying", endpoint, response.status_code)
+            time.sleep(self._delay(attempt, response.headers.get("Retry-After")))
+
+    def metrics(self):
+        """Return a snapshot of per-endpoint statistics."""
+        with self.lock:
+            return {endpoint: stats.snapshot() for endpoint, stats in self.stats.items()}
+
+    def close(self):
+        self.session.close()
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(self.max_delay, float(retry_after))
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _record(self, endpoint, latency, status, attempt):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.retries += attempt > 0
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if status is None or status >= 400:
+                stats.errors += 1
+            key = str(status) if status is not None else "connection_error"
+            stats.statuses[key] = stats.statuses.get(key, 0) + 1
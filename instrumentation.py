@@ -0,0 +1,191 @@
+import atexit
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, float("inf"))  # Span duration histogram bounds, seconds
+
+
+class SpanStats:
+    """Duration statistics for one span name and label set."""
+
+    __slots__ = ("count", "total", "max", "last", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class Metrics:
+    """In-process timing spans, counters and pluggable collectors.
+
+    Spans and counters are keyed by a name plus labels, e.g.
+    ``metrics.increment("cache_requests", cache="fundamentals", result="hit")``.
+    Collectors are callables returning ``{label_value: {field: value}}`` (such as
+    HttpTransport.metrics or MarketData.health) that are sampled when a snapshot
+    is taken. Recording is a lock and a few additions, cheap enough for hot paths.
+    """
+
+    def __init__(self):
+        self.spans = {}  # (name, labels) -> SpanStats
+        self.counters = {}  # (name, labels) -> int
+        self.collectors = {}  # name -> callable
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the with-block and record it under name and labels."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of span."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            stats = self.spans.get(key)
+            if stats is None:
+                stats = self.spans[key] = SpanStats()
+            stats.add(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        """Add amount to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def register_collector(self, name, collect):
+        """Sample collect() into every snapshot under name."""
+        self.collectors[name] = collect
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Return spans, counters and collector output as plain JSON-serializable data."""
+        with self.lock:
+            spans = [
+                {"name": name, "labels": dict(labels), "count": s.count, "total": s.total, "max": s.max, "last": s.last,
+                 "avg": s.total / s.count, "buckets": dict(zip(map(str, BUCKETS), s.buckets))}
+                for (name, labels), s in sorted(self.spans.items())
+            ]
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())]
+        collected = {}
+        for name, collect in self.collectors.items():
+            try:
+                collected[name] = collect()
+            except Exception as e:
+                collected[name] = {"error": str(e)}
+        return {"spans": spans, "counters": counters, "collectors": collected}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, default=str)
+
+    def to_prometheus(self, prefix="portfolio"):
+        """Render the snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        if snapshot["spans"]:
+            lines.append(f"# TYPE {prefix}_span_seconds histogram")
+        for span in snapshot["spans"]:
+            labels = dict(span["labels"], span=span["name"])
+            cumulative = 0
+            for bound, count in span["buckets"].items():
+                cumulative += count
+                lines.append(f"{prefix}_span_seconds_bucket{_labels(dict(labels, le='+Inf' if bound == 'inf' else bound))} {cumulative}")
+            lines.append(f"{prefix}_span_seconds_sum{_labels(labels)} {span['total']}")
+            lines.append(f"{prefix}_span_seconds_count{_labels(labels)} {span['count']}")
+        typed = set()
+        for counter in snapshot["counters"]:
+            name = f"{prefix}_{counter['name']}_total"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+        for collector, entries in snapshot["collectors"].items():
+            for key, fields in entries.items():
+                if not isinstance(fields, dict):
+                    continue
+                for field, value in fields.items():
+                    name = f"{prefix}_{collector}_{field}"
+                    if isinstance(value, bool) or value is None:
+                        continue
+                    if isinstance(value, (int, float)):
+                        lines.append(f"{name}{_labels({'name': key})} {value}")
+                    elif isinstance(value, dict):
+                        lines.extend(f"{name}{_labels({'name': key, 'key': k})} {v}" for k, v in value.items())
+                    elif field == "state":
+                        lines.append(f"{name}{_labels({'name': key, 'state': value})} 1")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the snapshot to path, as Prometheus text for .prom/.txt and JSON otherwise."""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w") as f:
+            f.write(text)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+metrics = Metrics()
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+
+    The stock handler formats every record on the calling thread before queueing
+    it; here the record is queued as-is, so a log call costs the caller only the
+    record creation and the message is built on the logging thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def start_queue_logging(handler, level=logging.DEBUG):
+    """Route the root logger through a queue to handler on a background thread."""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Flush queued records on exit
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(LazyQueueHandler(log_queue))
+    return listener
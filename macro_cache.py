@@ -0,0 +1,80 @@
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+MacroValue = namedtuple("MacroValue", ["value", "observation_date", "stale"])
+
+
+class MacroCache:
+    """Process-wide cache for slow-moving macro series such as the Moody's AAA yield.
+
+    Values are kept in memory and persisted to the ``macro_series`` table so the last
+    known observation survives restarts and is available offline. A series is only
+    re-fetched once its next observation is expected to be published, and at most
+    once per ``min_ttl`` after that.
+    """
+
+    def __init__(self, db, min_ttl=timedelta(days=1), retry_after=timedelta(hours=1)):
+        self.db = db
+        self.min_ttl = min_ttl
+        self.retry_after = retry_after
+        self.entries = {}  # series_id -> (value, observation_date, fetched_at)
+        self.failed_at = {}  # series_id -> datetime of last failed fetch
+        self.lock = threading.Lock()
+
+    def get(self, series_id, fetch, period=relativedelta(months=1), default=None):
+        """Return a MacroValue for series_id, calling fetch() -> (value, observation_date) only when due."""
+        with self.lock:
+            entry = self.entries.get(series_id) or self._load(series_id)
+            now = datetime.now()
+            if entry and now < self._expires_at(entry, period):
+                metrics.increment("cache_requests", cache="macro", endpoint=series_id, result="hit")
+                return MacroValue(entry[0], entry[1], False)
+            failed_at = self.failed_at.get(series_id)
+            if failed_at is None or now - failed_at >= self.retry_after:
+                metrics.increment("cache_requests", cache="macro", endpoint=series_id, result="miss")
+                try:
+                    value, observation_date = fetch()
+                    entry = (value, observation_date, now)
+                    self.entries[series_id] = entry
+                    self.failed_at.pop(series_id, None)
+                    self._store(series_id, entry)
+                    logger.info("Fetched %s observation %s: %s", series_id, observation_date, value)
+                    return MacroValue(value, observation_date, False)
+                except Exception as e:
+                    self.failed_at[series_id] = now
+                    logger.error("Error fetching %s, using cached value: %s", series_id, e)
+            if entry:
+                metrics.increment("cache_requests", cache="macro", endpoint=series_id, result="stale")
+                return MacroValue(entry[0], entry[1], True)
+            return MacroValue(default, None, True)
+
+    def _expires_at(self, entry, period):
+        value, observation_date, fetched_at = entry
+        # The observation for the following period is published roughly one period after it starts
+        next_release = datetime.strptime(observation_date, "%Y-%m-%d") + 2 * period
+        return max(next_release, fetched_at + self.min_ttl)
+
+    def _load(self, series_id):
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT value, observation_date, fetched_at FROM macro_series WHERE series_id = ?", (series_id,)).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], row[1], datetime.strptime(row[2], "%Y-%m-%d %H:%M:%S"))
+        self.entries[series_id] = entry
+        return entry
+
+    def _store(self, series_id, entry):
+        value, observation_date, fetched_at = entry
+        with self.db.transaction() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO macro_series (series_id, value, observation_date, fetched_at)
+                VALUES (?, ?, ?, ?)
+            """, (series_id, value, observation_date, fetched_at.strftime("%Y-%m-%d %H:%M:%S")))
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from fundamentals_cache import PRICE_TTL, QUOTE_TTL, INFO_TTL, next_filing_expiry
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+CAPABILITIES = ("price", "name", "eps_ttm", "annual_eps")
+
+# Providers tried, in order, for each capability unless overridden in .env
+DEFAULT_CHAINS = {
+    "price": ["yfinance", "fmp"],
+    "name": ["yfinance", "fmp"],
+    "eps_ttm": ["fmp", "yfinance"],
+    "annual_eps": ["fmp"],
+}
+
+
+class ProviderError(Exception):
+    """Raised when no provider in a chain could supply a value."""
+
+
+class YFinanceProvider:
+    """Price from a single 1-month history request; name and trailing EPS from one cached ``info`` scrape."""
+
+    capabilities = {"price", "name", "eps_ttm"}
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def available(self):
+        return True
+
+    def fetch(self, capability, symbol):
+        if capability == "price":
+            return self._price(symbol)
+        info = self._info(symbol)
+        return info["longName"] if capability == "name" else info["trailingEps"]
+
+    def _price(self, symbol):
+        cached = self.cache.get_fresh(symbol, "price")
+        if cached:
+            return cached["price"]
+        import yfinance as yf
+        hist = yf.Ticker(symbol).history(period="1mo")  # Covers the last week and day too, so no shorter retries
+        if hist.empty:
+            return None
+        price = float(hist["Close"].iloc[-1])
+        self.cache.put(symbol, "price", {"price": price}, datetime.now() + PRICE_TTL)
+        return price
+
+    def _info(self, symbol):
+        info = self.cache.get_fresh(symbol, "yf_info")
+        if info is None:
+            import yfinance as yf
+            stock_info = yf.Ticker(symbol).info  # Each access may trigger a slow scrape, so read it once
+            info = {"longName": stock_info.get("longName", symbol), "trailingEps": stock_info.get("trailingEps", None)}
+            self.cache.put(symbol, "yf_info", info, datetime.now() + INFO_TTL)
+        return info
+
+
+class FMPProvider:
+    """Quote (price, name, EPS) and income-statement EPS history from Financial Modeling Prep."""
+
+    capabilities = {"price", "name", "eps_ttm", "annual_eps"}
+
+    def __init__(self, cache, api_key, base_url, before_request=None):
+        self.cache = cache
+        self.api_key = api_key
+        self.base_url = base_url
+        self.before_request = before_request
+
+    def available(self):
+        return bool(self.api_key)
+
+    def fetch(self, capability, symbol):
+        if capability == "annual_eps":
+            url = f"{self.base_url}/income-statement/{symbol}?apikey={self.api_key}&limit=5"
+            income_data = self.cache.get_json(symbol, "income-statement", url, next_filing_expiry, self.before_request)
+            return [float(entry["eps"]) for entry in income_data if "eps" in entry][:5] or None  # Last 5 years
+        url = f"{self.base_url}/quote/{symbol}?apikey={self.api_key}"
+        quote_data = self.cache.get_json(symbol, "quote", url, QUOTE_TTL, self.before_request)
+        if not quote_data:
+            return None
+        value = quote_data[0].get({"price": "price", "name": "name", "eps_ttm": "eps"}[capability])
+        return float(value) if value is not None and capability != "name" else value
+
+
+class LocalFileProvider:
+    """Values from a local JSON file mapping symbol -> {price, name, eps_ttm, annual_eps}.
+
+    Useful offline or to pin values for symbols no online provider covers. The
+    file is re-read whenever its modification time changes.
+    """
+
+    capabilities = set(CAPABILITIES)
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def fetch(self, capability, symbol):
+        with self.lock:
+            mtime = os.path.getmtime(self.path)
+            if mtime != self.mtime:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+                self.mtime = mtime
+            return self.data.get(symbol, {}).get(capability)
+
+
+class CircuitBreaker:
+    """Health of one provider, opening after repeated failures or slow calls.
+
+    After ``failure_threshold`` consecutive failures (a call slower than
+    ``slow_after`` seconds counts as one) the breaker opens and the provider is
+    skipped. After ``reset_after`` seconds a single probe call is let through;
+    success closes the breaker again, failure re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_after=60.0, slow_after=5.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.slow_after = slow_after
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.calls = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_latency = 0.0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be made now."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = "half_open"  # Let exactly one probe through
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, latency, error=None):
+        """Record the outcome of a call."""
+        with self.lock:
+            self.calls += 1
+            self.total_latency += latency
+            if error is None and latency > self.slow_after:
+                error = f"slow call ({latency:.1f}s)"
+            if error is None:
+                self.consecutive_failures = 0
+                self.state = "closed"
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("Circuit for %s opened after %s failures: %s", self.name, self.consecutive_failures, error)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "state": self.state, "calls": self.calls, "failures": self.failures, "skipped": self.skipped,
+                "avg_latency": self.total_latency / self.calls if self.calls else None, "last_error": self.last_error,
+            }
+
+
+class MarketData:
+    """Fetch per-symbol market data through configurable provider fallback chains.
+
+    ``get(capability, symbol)`` tries each provider in the capability's chain,
+    skipping providers that are unavailable (e.g. no API key) or whose circuit
+    breaker is open, and returns the first non-None value. Concurrent requests
+    for the same (capability, symbol) are coalesced onto one in-flight fetch.
+    """
+
+    def __init__(self, providers=None, chains=None, **breaker_options):
+        self.providers = {}
+        self.breakers = {}
+        self.breaker_options = breaker_options
+        self.chains = {capability: list(chain) for capability, chain in DEFAULT_CHAINS.items()}
+        self.chains.update(chains or {})
+        self.in_flight = {}  # (capability, symbol) -> Future
+        self.lock = threading.Lock()
+        for name, provider in (providers or {}).items():
+            self.register(name, provider)
+
+    def register(self, name, provider):
+        """Add or replace a provider under name."""
+        self.providers[name] = provider
+        self.breakers[name] = CircuitBreaker(name, **self.breaker_options)
+
+    def get(self, capability, symbol):
+        """Return a value for symbol, or raise ProviderError if every provider failed or had no data."""
+        key = (capability, symbol)
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            value = self._fetch(capability, symbol)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def health(self):
+        """Return a snapshot of every provider's circuit breaker."""
+        return {name: breaker.snapshot() for name, breaker in self.breakers.items()}
+
+    def _fetch(self, capability, symbol):
+        errors = []
+        for name in self.chains.get(capability, []):
+            provider = self.providers.get(name)
+            if provider is None or capability not in provider.capabilities or not provider.available():
+                continue
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                errors.append(f"{name}: circuit open")
+                continue
+            started = time.monotonic()
+            try:
+                value = provider.fetch(capability, symbol)
+            except Exception as e:
+                metrics.observe("provider_fetch", time.monotonic() - started, provider=name, capability=capability)
+                metrics.increment("provider_calls", provider=name, capability=capability, result="error")
+                breaker.record(time.monotonic() - started, str(e))
+                logger.warning("%s failed to fetch %s for %s: %s", name, capability, symbol, e)
+                errors.append(f"{name}: {str(e)}")
+                continue
+            metrics.observe("provider_fetch", time.monotonic() - started, provider=name, capability=capability)
+            metrics.increment("provider_calls", provider=name, capability=capability, result="ok" if value is not None else "no_data")
+            breaker.record(time.monotonic() - started)
+            if value is not None:
+                return value
+            errors.append(f"{name}: no data")
+        raise ProviderError(f"No {capability} available for {symbol} ({'; '.join(errors) or 'no providers configured'})")
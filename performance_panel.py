@@ -0,0 +1,91 @@
+import logging
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+
+from instrumentation import metrics
+from portfolio_view import PortfolioTreeView
+
+logger = logging.getLogger()
+
+
+def _label(name, labels):
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}" if labels else "")
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f}" if seconds is not None else ""
+
+
+def metric_rows(snapshot):
+    """Flatten a Metrics snapshot into (key, values) rows for the panel."""
+    rows = {}
+    for span in snapshot["spans"]:
+        key = "span:" + _label(span["name"], span["labels"])
+        rows[key] = (key, span["count"], _ms(span["avg"]), _ms(span["max"]), _ms(span["last"]))
+    for counter in snapshot["counters"]:
+        key = "count:" + _label(counter["name"], counter["labels"])
+        rows[key] = (key, counter["value"], "", "", "")
+    for collector, entries in snapshot["collectors"].items():
+        for name, fields in entries.items():
+            if not isinstance(fields, dict):
+                continue
+            key = f"{collector}:{name}"
+            count = fields.get("requests", fields.get("calls", ""))
+            details = ", ".join(f"{k}={v}" for k, v in fields.items() if k not in ("requests", "calls", "avg_latency", "max_latency") and v)
+            rows[key] = (key, count, _ms(fields.get("avg_latency")), _ms(fields.get("max_latency")), details)
+    return rows
+
+
+class PerformancePanel:
+    """Non-modal window listing timing spans, counters and provider/HTTP health, refreshed every second."""
+
+    def __init__(self, master, interval_ms=1000):
+        self.interval_ms = interval_ms
+        self.window = tk.Toplevel(master)
+        self.window.title("Performance")
+        self.window.geometry("900x400")
+        self.tree = ttk.Treeview(self.window, columns=("Metric", "Count", "Avg", "Max", "Last"), show="headings")
+        for column, text, width in (("Metric", "Metric", 420), ("Count", "Count", 70), ("Avg", "Avg (ms)", 80),
+                                    ("Max", "Max (ms)", 80), ("Last", "Last (ms) / Details", 230)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, anchor="w" if column in ("Metric", "Last") else "e")
+        self.tree.pack(fill="both", expand=True)
+        self.view = PortfolioTreeView(self.tree)
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill="x")
+        ttk.Button(buttons, text="Save Metrics...", command=self.save).pack(side="left", padx=5, pady=5)
+        ttk.Button(buttons, text="Reset", command=self.reset).pack(side="left", padx=5, pady=5)
+        self.update()
+
+    def is_open(self):
+        return bool(self.window.winfo_exists())
+
+    def lift(self):
+        self.window.deiconify()
+        self.window.lift()
+
+    def update(self):
+        """Redraw changed rows and schedule the next update while the window is open."""
+        if not self.is_open():
+            return
+        self.view.replace_all(metric_rows(metrics.snapshot()))
+        self.window.after(self.interval_ms, self.update)
+
+    def reset(self):
+        metrics.reset()
+        self.view.clear()
+
+    def save(self):
+        """Dump metrics as JSON, or Prometheus text for .prom/.txt."""
+        path = filedialog.asksaveasfilename(
+            parent=self.window, defaultextension=".json", initialfile="portfolio_metrics.json",
+            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")]
+        )
+        if not path:
+            return
+        try:
+            metrics.dump(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to save metrics: {str(e)}", parent=self.window)
+            return
+        logger.info("Saved metrics to %s", path)
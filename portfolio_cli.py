@@ -0,0 +1,180 @@
+"""Headless command line for the portfolio tracker.
+
+Runs the same PortfolioEngine as the Tk app without importing tkinter or
+matplotlib, so it works over SSH, in cron and in CI. Every command prints one
+JSON document on stdout; errors print {"error": ...} on stderr and exit 1.
+
+    python portfolio_cli.py refresh
+    python portfolio_cli.py export portfolio.xlsx
+    python portfolio_cli.py import positions.csv
+    python portfolio_cli.py transaction AAPL sell 2024-05-01 --shares 10 --price 180
+    python portfolio_cli.py backfill
+    python portfolio_cli.py risk
+    python portfolio_cli.py screen watchlist.txt --top 25
+    python portfolio_cli.py history --tier weekly --start 2024-01-01
+    python portfolio_cli.py snapshot book.ptsnap
+    python portfolio_cli.py restore book.ptsnap
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from instrumentation import metrics
+from portfolio_engine import USER_DATA_DIR, PortfolioEngine, configure_logging
+from screener import read_watchlist
+
+logger = logging.getLogger()
+
+
+def _totals(frame):
+    return frame.totals()._asdict()
+
+
+def cmd_refresh(engine, args):
+    results, failed, frame = engine.refresh()
+    return {"refreshed": sorted(results), "failed": failed, "totals": _totals(frame)}, 1 if failed else 0
+
+
+def cmd_export(engine, args):
+    rows = engine.export(args.path)
+    return {"path": args.path, "rows": rows}, 0
+
+
+def cmd_import(engine, args):
+    imported, skipped = engine.import_csv(args.csv)
+    output = {"imported": imported, "skipped": skipped}
+    if args.no_refresh:
+        output["totals"] = _totals(engine.load_snapshot())
+        return output, 0
+    results, failed, frame = engine.refresh()
+    output.update(refreshed=sorted(results), failed=failed, totals=_totals(frame))
+    return output, 1 if failed else 0
+
+
+def cmd_transaction(engine, args):
+    holding = engine.add_transaction(args.symbol, args.kind, args.date, shares=args.shares, price=args.price,
+                                     ratio=args.ratio, amount=args.amount)
+    return {"holding": holding._asdict()}, 0
+
+
+def cmd_backfill(engine, args):
+    return {"days": engine.backfill_history()}, 0
+
+
+def cmd_risk(engine, args):
+    report = engine.risk_report()
+    if report is None:
+        return {"risk": None}, 0
+    risk = report._asdict()
+    risk["benchmarks"] = {name: benchmark._asdict() for name, benchmark in report.benchmarks.items()}
+    del risk["rolling_volatility"]
+    return {"risk": risk}, 0
+
+
+def cmd_screen(engine, args):
+    summary = engine.screen(read_watchlist(args.watchlist), full=args.full)
+    summary["top"] = [result._asdict() for result in engine.screener.results(limit=args.top)]
+    return summary, 0
+
+
+def cmd_history(engine, args):
+    if args.max_points:
+        rows = engine.history.series(args.max_points, start=args.start, end=args.end)
+    else:
+        rows = engine.history.range(args.tier, start=args.start, end=args.end)
+    return {"tier": args.tier, "history": [{"date": key, "total_value": value} for key, value in rows]}, 0
+
+
+def cmd_snapshot(engine, args):
+    path = engine.snapshot(args.path)
+    return {"path": path, "bytes": os.path.getsize(path)}, 0
+
+
+def cmd_restore(engine, args):
+    return {"path": args.path, "rows": engine.restore(args.path)}, 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="portfolio_cli", description="Headless portfolio tracker")
+    parser.add_argument("--data-dir", default=USER_DATA_DIR, help="directory holding portfolio.db and portfolio.log")
+    parser.add_argument("--metrics", help="after the command, write timings and counters to this file (.prom for Prometheus text, else JSON)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("refresh", help="refresh prices and fundamentals for all positions").set_defaults(func=cmd_refresh)
+
+    export = commands.add_parser("export", help="export to .xlsx, or history only to .csv/.parquet")
+    export.add_argument("path")
+    export.set_defaults(func=cmd_export)
+
+    import_ = commands.add_parser("import", help="bulk import transactions from a CSV file")
+    import_.add_argument("csv")
+    import_.add_argument("--no-refresh", action="store_true", help="skip refreshing quotes after the import")
+    import_.set_defaults(func=cmd_import)
+
+    transaction = commands.add_parser("transaction", help="record a buy, sell, split or dividend")
+    transaction.add_argument("symbol")
+    transaction.add_argument("kind", choices=["buy", "sell", "split", "dividend"])
+    transaction.add_argument("date", help="trade date (YYYY-MM-DD)")
+    transaction.add_argument("--shares", type=float)
+    transaction.add_argument("--price", type=float)
+    transaction.add_argument("--ratio", type=float, help="new shares per old share, for splits")
+    transaction.add_argument("--amount", type=float, help="total cash received, for dividends")
+    transaction.set_defaults(func=cmd_transaction)
+
+    commands.add_parser("backfill", help="rebuild daily history from transactions and historical closes").set_defaults(func=cmd_backfill)
+
+    commands.add_parser("risk", help="print return, drawdown, volatility, Sharpe and beta over the daily history").set_defaults(func=cmd_risk)
+
+    screen = commands.add_parser("screen", help="rank a watchlist by Graham margin of safety")
+    screen.add_argument("watchlist", help="text file with one ticker per line, or a CSV with a symbol column")
+    screen.add_argument("--full", action="store_true", help="re-fetch fundamentals for every symbol")
+    screen.add_argument("--top", type=int, default=50, help="number of ranked results to print")
+    screen.set_defaults(func=cmd_screen)
+
+    history = commands.add_parser("history", help="print recorded portfolio values")
+    history.add_argument("--tier", choices=["daily", "weekly", "intraday"], default="daily")
+    history.add_argument("--start", help="first date (YYYY-MM-DD), inclusive")
+    history.add_argument("--end", help="end date (YYYY-MM-DD), exclusive")
+    history.add_argument("--max-points", type=int, help="downsample daily history to at most this many points")
+    history.set_defaults(func=cmd_history)
+
+    snapshot = commands.add_parser("snapshot", help="save a snapshot of the whole database")
+    snapshot.add_argument("path", nargs="?", help="snapshot file (default: a timestamped file in DATA_DIR/snapshots)")
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    restore = commands.add_parser("restore", help="replace the database with a snapshot")
+    restore.add_argument("path")
+    restore.set_defaults(func=cmd_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args.data_dir)
+    try:
+        engine = PortfolioEngine(args.data_dir)
+    except Exception as e:
+        logger.error("Failed to open portfolio in %s: %s", args.data_dir, e)
+        json.dump({"error": str(e)}, sys.stderr)
+        sys.stderr.write("\n")
+        return 1
+    try:
+        output, status = args.func(engine, args)
+    except Exception as e:
+        logger.error("Command %s failed: %s", args.command, e)
+        json.dump({"error": str(e)}, sys.stderr)
+        sys.stderr.write("\n")
+        return 1
+    finally:
+        engine.close()
+        if args.metrics:
+            metrics.dump(args.metrics)
+    json.dump(output, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
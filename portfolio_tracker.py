@@ -1,39 +1,39 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import sqlite3
 import logging
 import os
-from decouple import config  # For .env file support
-import requests
+import sqlite3
+import threading
 from datetime import datetime
-import time
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import openpyxl
-from openpyxl.chart import LineChart, Reference
-from openpyxl.styles import Font, Alignment, PatternFill, Color
-import yfinance as yf
 from dateutil.relativedelta import relativedelta
+from analytics import PortfolioFrame, PortfolioTotals
+from benchmark_store import BENCHMARKS
+from performance_panel import PerformancePanel
+from portfolio_engine import PortfolioEngine, configure_logging
+from portfolio_view import PortfolioTreeView, format_position_row, format_risk_summary
+from scheduler import FUNDAMENTALS, MACRO, PRICES, PRIORITY
+from snapshot import SUFFIX as SNAPSHOT_SUFFIX
+from storage import Position
 
 # Setup logging
-USER_DATA_DIR = os.path.expanduser("~/PortfolioTracker")
-if not os.path.exists(USER_DATA_DIR):
-    os.makedirs(USER_DATA_DIR)
-logging.basicConfig(
-    filename=os.path.join(USER_DATA_DIR, 'portfolio.log'),
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger()
 
+STARTUP_REFRESH_DELAY_MS = 500  # Let the cached portfolio paint before refreshing it
+SCHEDULER_TICK_MS = 30000  # How often due background refresh jobs are checked
+
 class PortfolioTrackerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Portfolio Tracker")
         self.root.geometry("1400x900")
-        self.fmp_api_key = config('FMP_API_KEY')  # Load from .env
-        self.fred_api_key = config('FRED_API_KEY')  # Load from .env
         self.dark_mode = False
+        self.engine = PortfolioEngine()
+        self.refresh_rows = {}
+        self.refresh_results = {}
+        self.refresh_job = None  # Job of the running refresh
+        self.pending_job = None  # Job that superseded it, started once it finishes
+        self.macro_thread = None
 
         # Styling
         self.style = ttk.Style()
@@ -48,6 +48,7 @@ class PortfolioTrackerApp:
         self.main_frame.grid_rowconfigure(1, weight=1)
         self.main_frame.grid_rowconfigure(2, weight=0)
         self.main_frame.grid_rowconfigure(3, weight=1)
+        self.main_frame.grid_rowconfigure(4, weight=0)
 
         # Summary label
         self.summary_label = ttk.Label(self.main_frame, text="Portfolio Summary: Loading...", style="Summary.TLabel")
@@ -82,6 +83,7 @@ class PortfolioTrackerApp:
         self.tree.column("Margin", width=120, anchor="center")
         self.tree.column("Alert Threshold", width=120, anchor="center")
         self.tree.grid(row=1, column=0, sticky="nsew")
+        self.view = PortfolioTreeView(self.tree)
 
         # Scrollbar
         scrollbar = ttk.Scrollbar(self.main_frame, orient="vertical", command=self.tree.yview)
@@ -107,20 +109,47 @@ class PortfolioTrackerApp:
         self.alert_threshold_entry = ttk.Entry(self.entry_frame, width=10)
         self.alert_threshold_entry.pack(side="left", padx=5)
         ttk.Button(self.entry_frame, text="Add Stock", command=self.add_stock).pack(side="left", padx=5)
+        ttk.Button(self.entry_frame, text="Import CSV", command=self.import_csv).pack(side="left", padx=5)
         ttk.Button(self.entry_frame, text="Refresh Prices", command=self.refresh_prices).pack(side="left", padx=5)
         ttk.Button(self.entry_frame, text="Show Chart", command=self.show_chart).pack(side="left", padx=5)
         ttk.Button(self.entry_frame, text="Toggle Dark Mode", command=self.toggle_theme).pack(side="left", padx=5)
         ttk.Button(self.entry_frame, text="Export to Excel", command=self.export_to_excel).pack(side="left", padx=5)
+        ttk.Button(self.entry_frame, text="Save Snapshot", command=self.save_snapshot).pack(side="left", padx=5)
+        ttk.Button(self.entry_frame, text="Restore Snapshot", command=self.restore_snapshot).pack(side="left", padx=5)
         ttk.Button(self.entry_frame, text="Clear Portfolio", command=self.clear_portfolio).pack(side="left", padx=5)
+        ttk.Button(self.entry_frame, text="Performance", command=self.show_performance).pack(side="left", padx=5)
 
         # Chart frame
         self.chart_frame = ttk.Frame(self.main_frame)
         self.chart_frame.grid(row=3, column=0, columnspan=2, sticky="nsew")
-        self.chart_canvas = None
+        self.chart = None
+        self.performance_panel = None
+        self.export_job = None
+        self.backfill_thread = None
+        self.totals = PortfolioTotals(0, 0.0, 0.0, 0.0)
+
+        # Alerts panel (non-modal)
+        self.alert_frame = ttk.LabelFrame(self.main_frame, text="Price Alerts")
+        self.alert_frame.grid(row=4, column=0, columnspan=2, sticky="ew")
+        self.alert_list = tk.Listbox(self.alert_frame, height=4)
+        self.alert_list.pack(fill="x", expand=True)
+        self.engine.alert_engine.add_sink(self.show_alerts)
+
+        # Paint stored positions as soon as the window is idle, then refresh them in the background
+        self.show_alerts(list(reversed(self.engine.alert_engine.recent(20))))
+        self.root.after_idle(self.load_portfolio)
+        if self.engine.refresh_on_start:
+            self.root.after(STARTUP_REFRESH_DELAY_MS, self.refresh_prices)
+        else:
+            self.engine.scheduler.started(FUNDAMENTALS)  # Respect the setting: first scheduled refresh after one interval
+        if self.engine.auto_refresh:
+            self.root.after(SCHEDULER_TICK_MS, self.run_scheduler)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
-        # Initialize database and load portfolio
-        self.init_db()
-        self.load_portfolio()
+    def on_close(self):
+        """Stop background work and close the database before exiting."""
+        self.engine.close()
+        self.root.destroy()
 
     def apply_light_theme(self):
         """Apply light theme styling."""
@@ -143,78 +172,34 @@ class PortfolioTrackerApp:
             self.apply_dark_theme()
         else:
             self.apply_light_theme()
-        if self.chart_canvas:
-            self.show_chart()
-        logger.info(f"Toggled to {'dark' if self.dark_mode else 'light'} mode")
-
-    def init_db(self):
-        """Initialize SQLite database for portfolio and history."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS portfolio (
-                symbol TEXT PRIMARY KEY,
-                company_name TEXT,
-                purchase_date TEXT,
-                purchase_price REAL,
-                shares INTEGER,
-                price REAL,
-                eps_ttm REAL,
-                eps_cagr REAL,
-                intrinsic_value REAL,
-                alert_threshold REAL,
-                last_updated TEXT
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS portfolio_history (
-                date TEXT,
-                total_value REAL
-            )
-        """)
-        conn.commit()
-        conn.close()
+        if self.chart:
+            self.chart.apply_theme(self.dark_mode)
+        logger.info("Toggled to %s mode", "dark" if self.dark_mode else "light")
 
     def load_portfolio(self):
         """Load portfolio from database into treeview and update summary."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("SELECT symbol, company_name, purchase_date, purchase_price, shares, price, intrinsic_value, alert_threshold FROM portfolio")
-        rows = cursor.fetchall()
-        conn.close()
-
-        # Clear existing treeview entries
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        total_value = 0
-        total_gain_loss = 0
-        total_margin = 0
-        valid_rows = 0
-        for symbol, name, purchase_date, purchase_price, shares, price, intrinsic_value, alert_threshold in rows:
-            if not all([price, shares]) or purchase_price is None:  # Allow $0 purchase_price for splits
-                logger.warning(f"Skipping {symbol} due to missing data: price={price}, purchase_price={purchase_price}, shares={shares}")
-                continue
-            value = price * shares
-            gain_loss = (price - purchase_price) * shares
-            margin = ((intrinsic_value - price) / intrinsic_value * 100) if intrinsic_value and price and intrinsic_value > 0 else 0
-            self.tree.insert("", "end", values=(
-                symbol, name or "N/A", purchase_date or "N/A", f"${purchase_price:.2f}" if purchase_price is not None else "$0.00", shares, f"${price:.2f}", f"${value:.2f}",
-                f"${gain_loss:.2f}" if gain_loss > 0 else f"(${abs(gain_loss):.2f})", f"${intrinsic_value:.2f}" if intrinsic_value else "N/A",
-                f"{margin:.1f}%" if margin else "N/A", f"${alert_threshold:.2f}" if alert_threshold else "N/A"
-            ))
-            total_value += value
-            total_gain_loss += gain_loss
-            total_margin += margin  # Include 0 margins for average
-            valid_rows += 1
-            if alert_threshold and price and abs(price - alert_threshold) <= 0.05 * alert_threshold:
-                messagebox.showinfo("Price Alert", f"{symbol} price (${price:.2f}) is near alert threshold (${alert_threshold:.2f})")
-        avg_margin = total_margin / valid_rows if valid_rows > 0 else 0
-        self.summary_label.config(text=f"Portfolio Summary: {valid_rows} stocks, Total Value: ${total_value:.2f}, Total Gain/Loss: ${total_gain_loss:.2f}, Avg Margin of Safety: {avg_margin:.1f}%")
-        logger.info(f"Loaded portfolio, Total Value: ${total_value:.2f}, Total Gain/Loss: ${total_gain_loss:.2f}, Valid Stocks: {valid_rows}")
-
-        if valid_rows > 0:
-            self.save_portfolio_value(total_value)
+        frame = self.engine.load_snapshot()
+        for symbol, valid in zip(frame.symbols, frame.valid.tolist()):
+            if not valid:  # $0 purchase_price is allowed for splits
+                logger.warning("Skipping %s due to missing price, shares or purchase price", symbol)
+
+        self.view.replace_all({row[0]: format_position_row(*row) for row in frame.rows()})
+        self.update_summary(frame.totals())
+        if self.chart:
+            self.update_chart()
+
+    def show_alerts(self, alerts):
+        """Alert sink that lists newly fired alerts in the alerts panel."""
+        for alert in alerts:
+            self.alert_list.insert(0, f"{alert.fired_at:%Y-%m-%d %H:%M}  {alert.symbol} price (${alert.price:.2f}) is near alert threshold (${alert.threshold:.2f})")
+        self.alert_list.delete(100, tk.END)  # Keep the panel bounded
+
+    def update_summary(self, totals):
+        """Show portfolio totals in the summary bar."""
+        self.totals = totals
+        text = f"Portfolio Summary: {totals.count} stocks, Total Value: ${totals.total_value:.2f}, Total Gain/Loss: ${totals.total_gain_loss:.2f}, Avg Margin of Safety: {totals.avg_margin:.1f}%"
+        risk = format_risk_summary(self.engine.risk_report())
+        self.summary_label.config(text=f"{text} | {risk}" if risk else text)
 
     def add_stock(self):
         """Add a stock to the portfolio."""
@@ -223,57 +208,25 @@ class PortfolioTrackerApp:
         purchase_date = self.date_entry.get().strip()
         purchase_price = self.purchase_price_entry.get().strip()
         alert_threshold = self.alert_threshold_entry.get().strip()
-        if not symbol or not shares.isdigit() or not purchase_date or not purchase_price.replace('.', '').isdigit():
+        if not symbol or not shares.replace('.', '', 1).isdigit() or not purchase_date or not purchase_price.replace('.', '').isdigit():
             messagebox.showerror("Error", "Enter a valid symbol, number of shares, purchase date (YYYY-MM-DD), and purchase price")
             logger.error("Invalid input: All fields required")
             return
 
-        shares = int(shares)
+        shares = float(shares)  # Fractional shares are allowed
         purchase_price = float(purchase_price)
         alert_threshold = float(alert_threshold) if alert_threshold.replace('.', '').isdigit() else None
-        if not self.is_valid_date(purchase_date):
-            messagebox.showerror("Error", "Purchase date must be in YYYY-MM-DD format")
-            logger.error("Invalid purchase date format")
-            return
-
-        price, name, eps_ttm, eps_cagr = self.fetch_stock_data(symbol)
-        if price is None or name is None:
-            messagebox.showerror("Error", f"Failed to fetch data for {symbol}: Check ticker or network connection")
-            logger.error(f"Fetch failed for {symbol}: price={price}, name={name}")
+        if symbol in self.view:
+            logger.info("Stock %s already held, adding a lot", symbol)
+        try:
+            self.engine.add_position(symbol, shares, purchase_date, purchase_price, alert_threshold)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            logger.error("Failed to add %s: %s", symbol, e)
             return
 
-        intrinsic_value = self.calculate_graham_value(eps_ttm, eps_cagr) if eps_ttm and eps_cagr else None
-
-        # Save to database
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM portfolio WHERE symbol = ?", (symbol,))
-        if cursor.fetchone()[0] > 0:
-            logger.warning(f"Stock {symbol} already exists, updating instead")
-            cursor.execute("""
-                UPDATE portfolio SET company_name = ?, purchase_date = ?, purchase_price = ?, shares = ?, price = ?, eps_ttm = ?, eps_cagr = ?, intrinsic_value = ?, alert_threshold = ?, last_updated = ?
-                WHERE symbol = ?
-            """, (name, purchase_date, purchase_price, shares, price, eps_ttm, eps_cagr, intrinsic_value, alert_threshold, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), symbol))
-        else:
-            cursor.execute("""
-                INSERT INTO portfolio (symbol, company_name, purchase_date, purchase_price, shares, price, eps_ttm, eps_cagr, intrinsic_value, alert_threshold, last_updated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (symbol, name, purchase_date, purchase_price, shares, price, eps_ttm, eps_cagr, intrinsic_value, alert_threshold, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        conn.commit()
-        conn.close()
-
-        # Recalculate total_value for the new stock
-        value = price * shares
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("SELECT SUM(price * shares) FROM portfolio")
-        total_value = cursor.fetchone()[0] or 0
-        conn.close()
-
         # Update treeview and reload portfolio
-        self.load_portfolio()  # Clears and reloads treeview
-        intrinsic_str = f"{intrinsic_value:.2f}" if intrinsic_value is not None else "N/A"
-        logger.info(f"Added/Updated {symbol} with {shares} shares at purchase ${purchase_price:.2f}, current ${price:.2f}, intrinsic {intrinsic_str}")
+        self.load_portfolio()  # Diffs the treeview against the database and records portfolio history
 
         self.symbol_entry.delete(0, tk.END)
         self.shares_entry.delete(0, tk.END)
@@ -281,323 +234,251 @@ class PortfolioTrackerApp:
         self.purchase_price_entry.delete(0, tk.END)
         self.alert_threshold_entry.delete(0, tk.END)
 
-        # Update portfolio history
-        self.save_portfolio_value(total_value)
-
-    def is_valid_date(self, date_str):
-        """Validate date format YYYY-MM-DD."""
+    def import_csv(self):
+        """Bulk import positions from a CSV file, then refresh their prices."""
+        file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+        if not file_path:
+            return
         try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-            return True
-        except ValueError:
-            return False
+            count, skipped = self.engine.import_csv(file_path)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to import {file_path}: {str(e)}")
+            logger.error("Failed to import %s: %s", file_path, e)
+            return
+        messagebox.showinfo("Import Complete", f"Imported {count} transactions ({skipped} rows skipped)")
+        self.load_portfolio()
+        self.refresh_prices()
 
     def refresh_prices(self):
-        """Refresh stock prices in the portfolio."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("SELECT symbol, shares, purchase_price, alert_threshold FROM portfolio")
-        rows = cursor.fetchall()
-
-        # Clear treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Update prices with rate limiting
-        total_value = 0
-        total_gain_loss = 0
-        total_margin = 0
-        count = 0
-        for i, (symbol, shares, purchase_price, alert_threshold) in enumerate(rows):
-            price, name, eps_ttm, eps_cagr = self.fetch_stock_data(symbol)
-            if i % 5 == 0:  # Simple rate limit (5 calls per batch)
-                time.sleep(1)
-            if price is None or name is None:
-                logger.error(f"Failed to refresh data for {symbol}: price={price}, name={name}")
-                continue
-            intrinsic_value = self.calculate_graham_value(eps_ttm, eps_cagr) if eps_ttm and eps_cagr else None
-            cursor.execute("""
-                UPDATE portfolio SET price = ?, company_name = ?, eps_ttm = ?, eps_cagr = ?, intrinsic_value = ?, last_updated = ?
-                WHERE symbol = ?
-            """, (price, name, eps_ttm, eps_cagr, intrinsic_value, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), symbol))
-            value = price * shares
-            gain_loss = (price - purchase_price) * shares if purchase_price and price and shares else 0
-            margin = ((intrinsic_value - price) / intrinsic_value * 100) if intrinsic_value and price and intrinsic_value > 0 else 0
-            self.tree.insert("", "end", values=(
-                symbol, name or "N/A", "N/A" if not purchase_price else "N/A", f"${purchase_price:.2f}" if purchase_price is not None else "$0.00", shares, f"${price:.2f}", f"${value:.2f}",
-                f"${gain_loss:.2f}" if gain_loss > 0 else f"(${abs(gain_loss):.2f})", f"${intrinsic_value:.2f}" if intrinsic_value else "N/A",
-                f"{margin:.1f}%" if margin else "N/A", f"${alert_threshold:.2f}" if alert_threshold else "N/A"
-            ))
-            total_value += value
-            total_gain_loss += gain_loss
-            if margin is not None:  # Include all margins for average
-                total_margin += margin
-                count += 1
-            if alert_threshold and price and abs(price - alert_threshold) <= 0.05 * alert_threshold:
-                messagebox.showinfo("Price Alert", f"{symbol} price (${price:.2f}) is near alert threshold (${alert_threshold:.2f})")
-        conn.commit()
-        conn.close()
-        avg_margin = total_margin / count if count > 0 else 0
-        self.summary_label.config(text=f"Portfolio Summary: {count} stocks, Total Value: ${total_value:.2f}, Total Gain/Loss: ${total_gain_loss:.2f}, Avg Margin of Safety: {avg_margin:.1f}%")
-        logger.info(f"Refreshed {len(rows)} stocks, Total Value: ${total_value:.2f}, Total Gain/Loss: ${total_gain_loss:.2f}, Valid Stocks: {count}")
-
-        # Update portfolio history
-        self.save_portfolio_value(total_value)
-
-    def save_portfolio_value(self, total_value):
-        """Save total portfolio value to history."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO portfolio_history (date, total_value)
-            VALUES (?, ?)
-        """, (datetime.now().strftime("%Y-%m-%d"), total_value))
-        conn.commit()
-        conn.close()
-        logger.info(f"Saved portfolio value: ${total_value:.2f}")
+        """Refresh prices and fundamentals of the portfolio in the background."""
+        self.start_refresh(FUNDAMENTALS)
+
+    def start_refresh(self, job):
+        """Start a prices or fundamentals refresh, superseding a running one of lower priority.
+
+        Only one refresh runs at a time: a superseded run is cancelled and the new
+        job starts when it finishes; a job of equal or lower priority is dropped.
+        """
+        if self.engine.refresh_engine.is_running():
+            if PRIORITY[job] > PRIORITY[self.refresh_job]:
+                logger.info("Cancelling %s refresh in favour of %s", self.refresh_job, job)
+                self.pending_job = job
+                self.engine.refresh_engine.cancel()
+            else:
+                logger.info("Refresh already running, ignoring %s refresh", job)
+            return
+        self.engine.scheduler.started(job)
+        rows = self.engine.positions.all()
+        if not rows:
+            return
 
-    def show_chart(self):
-        """Display a chart of portfolio value vs benchmarks."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("SELECT date, total_value FROM portfolio_history ORDER BY date")
-        portfolio_rows = cursor.fetchall()
-        conn.close()
+        self.refresh_job = job
+        self.refresh_rows = {p.symbol: (p.purchase_date, p.shares, p.purchase_price, p.alert_threshold) for p in rows}
+        self.refresh_results = {}
+        self.summary_label.config(text=f"Portfolio Summary: Refreshing 0/{len(rows)} stocks...")
+        self.engine.start_refresh(self.engine.refresh_order(), prices_only=job == PRICES)
+        self.root.after(100, self.poll_refresh)
+
+    def run_scheduler(self):
+        """Start background refresh jobs that are due, then check again after SCHEDULER_TICK_MS."""
+        for job in self.engine.scheduler.due():
+            if job == MACRO:
+                if not (self.macro_thread and self.macro_thread.is_alive()):
+                    self.engine.scheduler.started(MACRO)
+                    self.macro_thread = threading.Thread(target=self.engine.get_aaa_yield, daemon=True)
+                    self.macro_thread.start()
+            elif not self.engine.refresh_engine.is_running() or PRIORITY[job] > PRIORITY[self.refresh_job]:
+                self.start_refresh(job)  # Otherwise it stays due until the running refresh finishes
+        self.root.after(SCHEDULER_TICK_MS, self.run_scheduler)
+
+    def poll_refresh(self):
+        """Apply refresh results that arrived since the last poll to the treeview."""
+        if self.refresh_job is None:
+            return  # The run was discarded by a snapshot restore
+        done = False
+        arrived = []
+        for kind, symbol, data in self.engine.refresh_engine.drain():
+            if kind == "done":
+                done = True
+            elif kind == "result" and symbol in self.refresh_rows:
+                self.refresh_results[symbol] = data
+                arrived.append(symbol)
+        if arrived:
+            frame = PortfolioFrame([self.refreshed_position(symbol) for symbol in arrived])
+            for row in frame.rows():
+                self.view.set_row(row[0], format_position_row(*row))
+        if not done:
+            self.summary_label.config(text=f"Portfolio Summary: Refreshing {len(self.refresh_results)}/{len(self.refresh_rows)} stocks...")
+            self.root.after(100, self.poll_refresh)
+            return
+        self.finish_refresh()
+
+    def refreshed_position(self, symbol):
+        """Combine a symbol's stored purchase details with its refreshed quote."""
+        price, name, eps_ttm, eps_cagr, intrinsic_value = self.refresh_results[symbol]
+        purchase_date, shares, purchase_price, alert_threshold = self.refresh_rows[symbol]
+        return Position(symbol, name, purchase_date, purchase_price, shares, price, intrinsic_value, alert_threshold)
+
+    def finish_refresh(self):
+        """Persist refreshed quotes, update the summary and fire price alerts, then start any superseding job."""
+        self.engine.refresh_engine.join()
+        self.refresh_job = None
+        frame = self.engine.apply_refresh(self.refresh_results)
+        self.update_summary(frame.totals())
+        if self.chart:
+            self.update_chart()
+            self.start_backfill()  # Picks up closes for sessions that ended since the chart was drawn
+        if self.pending_job:
+            job, self.pending_job = self.pending_job, None
+            self.start_refresh(job)
 
-        if not portfolio_rows:
+    def show_chart(self):
+        """Display a chart of portfolio value vs benchmarks, backfilling missing days in the background."""
+        if not self.engine.history.all() and not len(self.engine.holdings):
             messagebox.showinfo("No Data", "No portfolio history available")
             return
+        if self.chart is None:
+            from chart import PortfolioChart  # matplotlib is only loaded the first time the chart is shown
+            self.chart = PortfolioChart(self.chart_frame, ["Portfolio"] + list(BENCHMARKS), self.dark_mode)
+        self.update_chart()
+        self.start_backfill()
+        logger.info("Displayed portfolio vs benchmarks chart")
+
+    def start_backfill(self):
+        """Backfill daily history and download missing benchmark closes on a background thread, then redraw the chart."""
+        if self.backfill_thread and self.backfill_thread.is_alive():
+            return
+        self.backfill_thread = threading.Thread(target=self._backfill, daemon=True)
+        self.backfill_thread.start()
+        self.root.after(200, self.poll_backfill)
 
+    def _backfill(self):
+        try:
+            self.engine.backfill_history()
+        except Exception as e:
+            logger.error("History backfill failed: %s", e)
+        try:
+            self.engine.update_benchmarks()
+        except Exception as e:
+            logger.error("Benchmark update failed: %s", e)
+
+    def poll_backfill(self):
+        """Redraw the chart once the background backfill finishes."""
+        if self.backfill_thread.is_alive():
+            self.root.after(200, self.poll_backfill)
+            return
+        if self.chart:
+            self.update_chart()
+
+    def update_chart(self):
+        """Load history and stored benchmark series into the existing chart; downloads happen in start_backfill."""
+        portfolio_rows = self.engine.history.series(max_points=max(self.chart_frame.winfo_width(), 800))
+        if not portfolio_rows:
+            return
         dates, portfolio_values = zip(*portfolio_rows)
         start_date = datetime.strptime(dates[0], "%Y-%m-%d") - relativedelta(months=1)
         end_date = datetime.strptime(dates[-1], "%Y-%m-%d") + relativedelta(days=1)
-
-        # Fetch benchmark data with yfinance
-        benchmarks = {
-            "S&P 500": "^GSPC",
-            "NYSE Composite": "^NYA",
-            "NASDAQ Composite": "^IXIC"
-        }
-        benchmark_data = {}
-        for name, ticker in benchmarks.items():
-            try:
-                data = yf.download(ticker, start=start_date, end=end_date)['Close']
-                benchmark_data[name] = (data.index.strftime("%Y-%m-%d").tolist(), data.values)
-            except Exception as e:
-                logger.error(f"Error fetching {name} data: {str(e)}")
-                benchmark_data[name] = ([], [])
-
-        # Normalize portfolio values to start at 100 for comparison
-        portfolio_base = portfolio_values[0] if portfolio_values else 100
-        normalized_portfolio = [100 * v / portfolio_base for v in portfolio_values]
-
-        # Create chart
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.plot(dates, normalized_portfolio, marker='o', label='Portfolio', color='#1f77b4' if not self.dark_mode else '#64B5F6')
-        colors = ['#ff7f0e', '#2ca02c', '#d62728'] if not self.dark_mode else ['#ffaa00', '#66cc66', '#ff6666']
-        for (name, (b_dates, b_values)), color in zip(benchmark_data.items(), colors):
-            if b_values.size > 0:
-                base_value = b_values[0] if b_values.size > 0 else 100
-                normalized_bench = [100 * v / base_value for v in b_values]
-                ax.plot(b_dates, normalized_bench, marker='s', label=name, color=color)
-        ax.set_title("Portfolio vs Benchmarks (Normalized)", fontsize=14, color='black' if not self.dark_mode else 'white')
-        ax.set_xlabel("Date", fontsize=12, color='black' if not self.dark_mode else 'white')
-        ax.set_ylabel("Normalized Value (Base 100)", fontsize=12, color='black' if not self.dark_mode else 'white')
-        ax.legend()
-        ax.tick_params(axis='x', rotation=45, colors='black' if not self.dark_mode else 'white')
-        ax.tick_params(axis='y', colors='black' if not self.dark_mode else 'white')
-        ax.grid(True, linestyle='--', alpha=0.7, color='gray' if not self.dark_mode else 'lightgray')
-        ax.set_facecolor('#f0f0f0' if not self.dark_mode else '#333333')
-        fig.set_facecolor('#f0f0f0' if not self.dark_mode else '#333333')
-        plt.tight_layout()
-
-        # Embed in Tkinter
-        if self.chart_canvas:
-            self.chart_canvas.get_tk_widget().destroy()
-        self.chart_canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-        self.chart_canvas.draw()
-        self.chart_canvas.get_tk_widget().pack(fill="both", expand=True)
-        self.chart_canvas.get_tk_widget().configure(bg='#f0f0f0' if not self.dark_mode else '#333333')
-        plt.close(fig)
-        logger.info("Displayed portfolio vs benchmarks chart")
+        series = {name: self.engine.benchmark_store.series(ticker, start_date, end_date) for name, ticker in BENCHMARKS.items()}
+        series["Portfolio"] = (dates, portfolio_values)
+        self.chart.set_data(series)
 
     def export_to_excel(self):
-        """Export portfolio data to an Excel file."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("SELECT symbol, company_name, purchase_date, purchase_price, shares, price, intrinsic_value, alert_threshold FROM portfolio")
-        rows = cursor.fetchall()
-        cursor.execute("SELECT date, total_value FROM portfolio_history ORDER BY date")
-        history_rows = cursor.fetchall()
-        conn.close()
-
-        if not rows:
+        """Export portfolio data to an Excel file (or history to CSV/Parquet) in the background."""
+        if self.export_job and self.export_job.is_running():
+            logger.info("Export already running, ignoring click")
+            return
+        if not self.engine.positions.all():
             messagebox.showinfo("No Data", "No portfolio data to export")
             return
 
-        # Create workbook
-        wb = openpyxl.Workbook()
-        sheet = wb.active
-        sheet.title = "Portfolio Summary"
-
-        # Headers
-        headers = ["Symbol", "Company Name", "Purchase Date", "Purchase Price ($)", "Shares", "Current Price ($)", "Total Value ($)", "Gain/Loss ($)", "Intrinsic Value ($)", "Margin of Safety (%)", "Alert Threshold ($)"]
-        for col, header in enumerate(headers, 1):
-            cell = sheet.cell(row=1, column=col)
-            cell.value = header
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center")
-
-        # Data
-        green_fill = PatternFill(start_color=Color(rgb="90EE90"), end_color=Color(rgb="90EE90"), fill_type="solid")
-        red_fill = PatternFill(start_color=Color(rgb="FFB6C1"), end_color=Color(rgb="FFB6C1"), fill_type="solid")
-        for row_idx, (symbol, name, purchase_date, purchase_price, shares, price, intrinsic_value, alert_threshold) in enumerate(rows, 2):
-            value = price * shares if price and shares else 0
-            gain_loss = (price - purchase_price) * shares if purchase_price and price and shares else 0
-            margin = ((intrinsic_value - price) / intrinsic_value * 100) if intrinsic_value and price and intrinsic_value > 0 else 0
-            sheet.cell(row=row_idx, column=1, value=symbol)
-            sheet.cell(row=row_idx, column=2, value=name or "N/A")
-            sheet.cell(row=row_idx, column=3, value=purchase_date or "N/A")
-            sheet.cell(row=row_idx, column=4, value=purchase_price).number_format = "$#,##0.00"
-            sheet.cell(row=row_idx, column=5, value=shares)
-            sheet.cell(row=row_idx, column=6, value=price).number_format = "$#,##0.00"
-            sheet.cell(row=row_idx, column=7, value=value).number_format = "$#,##0.00"
-            gain_loss_cell = sheet.cell(row=row_idx, column=8, value=gain_loss)
-            gain_loss_cell.number_format = "$#,##0.00"
-            if gain_loss > 0:
-                gain_loss_cell.fill = green_fill
-            elif gain_loss < 0:
-                gain_loss_cell.fill = red_fill
-            sheet.cell(row=row_idx, column=9, value=intrinsic_value if intrinsic_value else "N/A").number_format = "$#,##0.00"
-            sheet.cell(row=row_idx, column=10, value=margin if margin else "N/A").number_format = "0.0%"
-            sheet.cell(row=row_idx, column=11, value=alert_threshold if alert_threshold else "N/A").number_format = "$#,##0.00"
-
-        # Add history sheet
-        history_sheet = wb.create_sheet("Portfolio History")
-        history_sheet.append(["Date", "Total Value ($)"])
-        for row_idx, (date, value) in enumerate(history_rows, 2):
-            history_sheet.cell(row_idx, 1, value=date)
-            history_sheet.cell(row_idx, 2, value=value).number_format = "$#,##0.00"
-
-        # Add chart to history sheet
-        chart = LineChart()
-        chart.title = "Portfolio Value Over Time"
-        chart.x_axis.title = "Date"
-        chart.y_axis.title = "Value ($)"
-        data = Reference(history_sheet, min_col=2, min_row=1, max_row=len(history_rows) + 1)
-        dates = Reference(history_sheet, min_col=1, min_row=2, max_row=len(history_rows) + 1)
-        chart.add_data(data, titles_from_data=True)
-        chart.set_categories(dates)
-        history_sheet.add_chart(chart, "D2")
-
-        # Save file
         file_path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel files", "*.xlsx")],
+            filetypes=[("Excel files", "*.xlsx"), ("History CSV", "*.csv"), ("History Parquet", "*.parquet")],
             initialfile="Portfolio_Export.xlsx"
         )
-        if file_path:
-            wb.save(file_path)
-            messagebox.showinfo("Success", f"Portfolio exported to {file_path}")
-            logger.info(f"Exported portfolio to {file_path}")
+        if not file_path:
+            return
+        from excel_export import EXPORTERS, ExportJob, export_excel  # openpyxl is only loaded on first export
+        exporter = EXPORTERS.get(os.path.splitext(file_path)[1].lower(), export_excel)
+        options = {"risk_report": self.engine.risk_report()} if exporter is export_excel else {}
+        self.export_job = ExportJob(exporter, self.engine.db, file_path, **options)
+        self.export_job.start()
+        self.root.after(100, self.poll_export)
+
+    def poll_export(self):
+        """Report export progress until the background export finishes."""
+        job = self.export_job
+        if job.is_running():
+            done, total = job.progress
+            self.summary_label.config(text=f"Exporting to {os.path.basename(job.path)}: {done}/{total} rows...")
+            self.root.after(100, self.poll_export)
+            return
+        self.update_summary(self.totals)
+        if job.error:
+            messagebox.showerror("Error", f"Export failed: {str(job.error)}")
+        else:
+            messagebox.showinfo("Success", f"Portfolio exported to {job.path}")
+            logger.info("Exported portfolio to %s", job.path)
 
-    def fetch_stock_data(self, symbol):
-        """Fetch stock price and name from yfinance, EPS TTM and CAGR from FMP if available."""
-        try:
-            # Primary source: yfinance for price and name
-            stock = yf.Ticker(symbol)
-            hist = stock.history(period="1mo")  # Use 1 month to ensure data
-            if hist.empty:
-                logger.warning(f"No 1-month data for {symbol}, trying 1-week period")
-                hist = stock.history(period="1wk")
-                if hist.empty:
-                    logger.warning(f"No 1-week data for {symbol}, trying 1-day period")
-                    hist = stock.history(period="1d")
-                    if hist.empty:
-                        raise ValueError(f"No data available for {symbol}")
-            price = float(hist["Close"].iloc[-1])
-            name = stock.info.get("longName", symbol)
-            logger.debug(f"yfinance data for {symbol}: price={price}, name={name}")
-
-            # Optional: Fetch EPS TTM and historical EPS from FMP
-            url = f"https://financialmodelingprep.com/api/v3/quote/{symbol}?apikey={self.fmp_api_key}"
-            response = requests.get(url)
-            response.raise_for_status()
-            quote_data = response.json()
-            if quote_data and "eps" in quote_data[0]:
-                eps_ttm = float(quote_data[0]["eps"])
-            else:
-                eps_ttm = stock.info.get("trailingEps", None)  # Fallback to yfinance
-                logger.warning(f"No EPS TTM from FMP for {symbol}, using yfinance: {eps_ttm}")
-
-            url = f"https://financialmodelingprep.com/api/v3/income-statement/{symbol}?apikey={self.fmp_api_key}&limit=5"
-            response = requests.get(url)
-            response.raise_for_status()
-            income_data = response.json()
-            annual_eps = [float(entry["eps"]) for entry in income_data if "eps" in entry][:5]  # Last 5 years
-            if not annual_eps:
-                logger.warning(f"No historical EPS from FMP for {symbol}, using yfinance fallback")
-                annual_eps = [stock.info.get("trailingEps", 0)] * 5  # Fallback to current EPS
-            eps_cagr = self.calculate_cagr(annual_eps[0], annual_eps[-1], len(annual_eps) - 1) if len(annual_eps) >= 2 else 0
-            logger.debug(f"FMP data for {symbol}: eps_ttm={eps_ttm}, eps_cagr={eps_cagr}")
-
-            return price, name, eps_ttm, eps_cagr
-        except Exception as e:
-            logger.error(f"Error fetching data for {symbol}: {str(e)}")
-            return None, None, None, None
-
-    def calculate_cagr(self, start_value, end_value, periods):
-        """Calculate Compound Annual Growth Rate."""
-        if not isinstance(start_value, (int, float)) or not isinstance(end_value, (int, float)):
-            logger.error(f"Invalid CAGR inputs: start_value={start_value}, end_value={end_value}")
-            return 0
-        if start_value <= 0 or end_value <= 0 or periods <= 0:
-            return 0
+    def show_performance(self):
+        """Open the performance panel, or raise it if already open."""
+        if self.performance_panel and self.performance_panel.is_open():
+            self.performance_panel.lift()
+            return
+        self.performance_panel = PerformancePanel(self.root)
+
+    def save_snapshot(self):
+        """Save a snapshot of the whole database to a file."""
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=SNAPSHOT_SUFFIX,
+            filetypes=[("Portfolio snapshots", f"*{SNAPSHOT_SUFFIX}")],
+            initialdir=self.engine.snapshot_dir,
+            initialfile=f"portfolio-{datetime.now():%Y%m%d-%H%M%S}{SNAPSHOT_SUFFIX}"
+        )
+        if not file_path:
+            return
         try:
-            return ((end_value / start_value) ** (1 / periods) - 1)
-        except ZeroDivisionError:
-            return 0
-
-    def calculate_graham_value(self, eps_ttm, eps_cagr):
-        """Calculate Graham intrinsic value using EPS and EPS CAGR."""
-        if not eps_ttm or eps_ttm <= 0 or not eps_cagr or not isinstance(eps_cagr, (int, float)):
-            logger.warning(f"Invalid Graham inputs: eps_ttm={eps_ttm}, eps_cagr={eps_cagr}")
-            return None
-        aaa_yield = self.get_aaa_yield()
-        if aaa_yield <= 0:
-            return None
-        g = float(eps_cagr) * 100  # Convert to percentage, ensure float
-        earnings_multiplier = min(8.5 + 2 * g, 20)  # Cap at 20
-        normalization_factor = 4.4
-        value = (eps_ttm * earnings_multiplier * normalization_factor) / (100 * aaa_yield)
-        return value
-
-    def get_aaa_yield(self, default_yield=0.045):
-        """Fetch Moody's AAA Corporate Bond Yield from FRED."""
+            self.engine.snapshot(file_path)
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("Error", f"Failed to save snapshot: {str(e)}")
+            logger.error("Failed to save snapshot %s: %s", file_path, e)
+            return
+        messagebox.showinfo("Snapshot Saved", f"Saved snapshot to {file_path}")
+
+    def restore_snapshot(self):
+        """Replace the portfolio, history and cached market data with a snapshot."""
+        file_path = filedialog.askopenfilename(filetypes=[("Portfolio snapshots", f"*{SNAPSHOT_SUFFIX}")],
+                                               initialdir=self.engine.snapshot_dir)
+        if not file_path:
+            return
+        if not messagebox.askyesno("Restore Snapshot", "Replace the current portfolio with this snapshot?"):
+            return
+        self.pending_job = None
+        self.refresh_rows = {}
+        self.refresh_results = {}
         try:
-            url = f"https://api.stlouisfed.org/fred/series/observations?series_id=AAA&api_key={self.fred_api_key}&file_type=json&limit=1&sort_order=desc"
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            if 'observations' in data and data['observations']:
-                return float(data['observations'][0]['value']) / 100
-            return default_yield
-        except Exception as e:
-            logger.error(f"Error fetching AAA yield: {str(e)}")
-            return default_yield
+            counts = self.engine.restore(file_path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Error", f"Failed to restore {file_path}: {str(e)}")
+            logger.error("Failed to restore %s: %s", file_path, e)
+            return
+        finally:
+            self.engine.refresh_engine.drain()  # Discard the results of a refresh the restore cancelled
+            self.refresh_job = None
+        self.load_portfolio()
+        messagebox.showinfo("Snapshot Restored", f"Restored {sum(counts.values())} rows from {os.path.basename(file_path)}")
 
     def clear_portfolio(self):
-        """Clear all portfolio data from the database and treeview."""
-        conn = sqlite3.connect(os.path.join(USER_DATA_DIR, "portfolio.db"))
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM portfolio")
-        cursor.execute("DELETE FROM portfolio_history")
-        conn.commit()
-        conn.close()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.summary_label.config(text="Portfolio Summary: 0 stocks, Total Value: $0.00, Total Gain/Loss: $0.00, Avg Margin of Safety: 0.0%")
-        logger.info("Cleared portfolio and history")
+        """Clear all portfolio data from the database and treeview, keeping a snapshot to restore."""
+        self.pending_job = None
+        self.refresh_rows = {}
+        self.refresh_results = {}
+        path = self.engine.clear()
+        self.view.clear()
+        if self.chart:
+            self.chart.set_data({})
+        self.update_summary(PortfolioTotals(0, 0.0, 0.0, 0.0))
+        messagebox.showinfo("Portfolio Cleared", f"Saved a snapshot before clearing; use Restore Snapshot to undo:\n{path}")
 
 if __name__ == "__main__":
     root = tk.Tk()
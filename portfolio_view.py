@@ -0,0 +1,99 @@
+import logging
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+
+def format_position_row(symbol, name, purchase_date, purchase_price, shares, price, value, gain_loss, intrinsic_value, margin, alert_threshold):
+    """Format one position as the tuple of strings shown in the treeview."""
+    return (
+        symbol, name or "N/A", purchase_date or "N/A", f"${purchase_price:.2f}" if purchase_price is not None else "$0.00", shares, f"${price:.2f}", f"${value:.2f}",
+        f"${gain_loss:.2f}" if gain_loss > 0 else f"(${abs(gain_loss):.2f})", f"${intrinsic_value:.2f}" if intrinsic_value else "N/A",
+        f"{margin:.1f}%" if margin else "N/A", f"${alert_threshold:.2f}" if alert_threshold else "N/A"
+    )
+
+
+def format_risk_summary(report, benchmark="S&P 500"):
+    """Format a risk.RiskReport for the summary bar, or '' if there is not enough history."""
+    if report is None:
+        return ""
+    parts = [f"TWR: {report.twr * 100:.1f}%", f"Max Drawdown: {report.max_drawdown * 100:.1f}%"]
+    if report.volatility is not None:
+        parts.append(f"Volatility: {report.volatility * 100:.1f}%")
+    if report.sharpe is not None:
+        parts.append(f"Sharpe: {report.sharpe:.2f}")
+    beta = report.benchmarks.get(benchmark)
+    if beta and beta.beta is not None:
+        parts.append(f"Beta ({benchmark}): {beta.beta:.2f}")
+    return ", ".join(parts)
+
+
+class PortfolioTreeView:
+    """View model that keeps treeview rows keyed by symbol and applies only what changed.
+
+    ``rows`` holds the values each symbol should display. Setting a row that differs
+    from what is already shown marks it dirty, and all dirty rows are written to the
+    treeview in a single idle callback, so the cost of an update is proportional to
+    the number of changed rows rather than the size of the portfolio.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.rows = {}  # symbol -> values the row should display
+        self.shown = {}  # symbol -> values currently in the treeview
+        self.dirty = set()
+        self.flush_id = None
+
+    def __contains__(self, symbol):
+        return symbol in self.rows
+
+    def set_row(self, symbol, values):
+        """Show values for symbol, inserting the row if needed."""
+        self.rows[symbol] = values
+        self._mark(symbol)
+
+    def remove_row(self, symbol):
+        """Remove the row for symbol if present."""
+        if self.rows.pop(symbol, None) is not None:
+            self._mark(symbol)
+
+    def replace_all(self, rows):
+        """Make the treeview show exactly rows (symbol -> values), touching only differences."""
+        for symbol in list(self.rows):
+            if symbol not in rows:
+                self.remove_row(symbol)
+        for symbol, values in rows.items():
+            self.set_row(symbol, values)
+
+    def clear(self):
+        """Remove every row."""
+        self.replace_all({})
+
+    def _mark(self, symbol):
+        if self.shown.get(symbol) == self.rows.get(symbol):
+            self.dirty.discard(symbol)
+            return
+        self.dirty.add(symbol)
+        if self.flush_id is None:
+            self.flush_id = self.tree.after_idle(self.flush)
+
+    @metrics.timed("treeview_flush")
+    def flush(self):
+        """Apply all pending row changes to the treeview."""
+        self.flush_id = None
+        dirty, self.dirty = self.dirty, set()
+        metrics.increment("treeview_rows", len(dirty))
+        for symbol in dirty:
+            values = self.rows.get(symbol)
+            if values is None:
+                if self.tree.exists(symbol):
+                    self.tree.delete(symbol)
+                self.shown.pop(symbol, None)
+            elif symbol in self.shown:
+                self.tree.item(symbol, values=values)
+                self.shown[symbol] = values
+            else:
+                self.tree.insert("", "end", iid=symbol, values=values)
+                self.shown[symbol] = values
+        logger.debug("Applied %d treeview row changes", len(dirty))
@@ -0,0 +1,177 @@
+from array import array
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+
+Holding = namedtuple("Holding", ["symbol", "shares", "cost_basis", "avg_cost", "first_date", "realized_gain", "dividends", "lots"])
+
+COLUMNS = ("shares", "cost_basis", "realized_gain", "dividends")
+
+
+def _column(values, typecode):
+    """Copy a NumPy vector into an array.array column without a per-element loop."""
+    column = array(typecode)
+    column.frombytes(np.ascontiguousarray(values, dtype=np.float64 if typecode == "d" else np.int64).tobytes())
+    return column
+
+
+class PositionIndex:
+    """Per-symbol holdings aggregated from buy/sell/split/dividend transactions.
+
+    Aggregates live in array-backed columns indexed by a slot per symbol rather
+    than in per-lot Python objects: shares, cost basis (average-cost method),
+    realized gain, dividends, buys since the position was opened, and the first
+    purchase date and last transaction date as day ordinals. ``load`` aggregates
+    a whole transaction log, vectorized for symbols that only have buys and
+    dividends, and ``apply`` folds in one new transaction in O(1).
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.slots = {}  # symbol -> index into the columns
+        self.symbols = []
+        self.shares = array("d")
+        self.cost_basis = array("d")
+        self.realized_gain = array("d")
+        self.dividends = array("d")
+        self.lots = array("q")
+        self.first_date = array("q")  # Ordinal of the earliest buy still held, 0 if none
+        self.last_date = array("q")  # Ordinal of the latest transaction applied
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.slots
+
+    def load(self, transactions):
+        """Rebuild every aggregate from storage.Transaction rows sorted by trade date."""
+        self.clear()
+        if not transactions:
+            return
+        symbols, kinds, dates, shares, prices, ratios, amounts = zip(*transactions)
+        codes = np.array([self.slots.setdefault(symbol, len(self.slots)) for symbol in symbols])
+        self.symbols = list(self.slots)
+        count = len(self.symbols)
+        kinds = np.array(kinds)
+        shares = np.array(shares, dtype=float)
+        prices = np.array(prices, dtype=float)
+        amounts = np.array(amounts, dtype=float)
+
+        # Sells and splits make aggregates order dependent; those symbols are replayed one transaction at a time
+        sequential = np.zeros(count, dtype=bool)
+        sequential[codes[(kinds == "sell") | (kinds == "split")]] = True
+        simple = ~sequential[codes]
+        buys = simple & (kinds == "buy")
+        dividends = simple & (kinds == "dividend")
+
+        # Rows are date sorted, so each symbol's first buy and last transaction are found by position alone
+        first = np.zeros(count, dtype=np.int64)
+        buy_rows = np.flatnonzero(buys)
+        buy_codes, first_index = np.unique(codes[buy_rows], return_index=True)
+        first[buy_codes] = [date.fromisoformat(dates[i]).toordinal() for i in buy_rows[first_index]]
+        last = np.zeros(count, dtype=np.int64)
+        last_codes, last_index = np.unique(codes[::-1], return_index=True)
+        last[last_codes] = [date.fromisoformat(dates[len(dates) - 1 - i]).toordinal() for i in last_index]
+
+        self.shares = _column(np.bincount(codes[buys], weights=shares[buys], minlength=count), "d")
+        self.cost_basis = _column(np.bincount(codes[buys], weights=shares[buys] * prices[buys], minlength=count), "d")
+        self.realized_gain = _column(np.zeros(count), "d")
+        self.dividends = _column(np.bincount(codes[dividends], weights=np.nan_to_num(amounts[dividends]), minlength=count), "d")
+        self.lots = _column(np.bincount(codes[buys], minlength=count), "q")
+        self.first_date = _column(first, "q")
+        self.last_date = _column(last, "q")
+
+        replay = sequential[codes]
+        if replay.any():
+            self.reset({symbols[i] for i in np.flatnonzero(replay)},
+                       [transactions[i] for i in np.flatnonzero(replay)])
+
+    def reset(self, symbols, transactions):
+        """Recompute the aggregates of symbols from their complete, date-sorted transactions."""
+        for symbol in symbols:
+            slot = self._slot(symbol)
+            for column in COLUMNS:
+                getattr(self, column)[slot] = 0.0
+            self.lots[slot] = self.first_date[slot] = self.last_date[slot] = 0
+        for transaction in transactions:
+            self.apply(transaction, check_order=False)
+
+    def apply(self, transaction, check_order=True):
+        """Fold one transaction into its symbol's aggregates.
+
+        Raises ValueError, leaving the aggregates untouched, for a sell of more
+        shares than are held or (with check_order) a transaction dated before the
+        symbol's latest one, which must go through ``reset`` instead.
+        """
+        symbol, kind, trade_date, shares, price, ratio, amount = transaction
+        slot = self._slot(symbol)
+        ordinal = date.fromisoformat(trade_date).toordinal()
+        if check_order and ordinal < self.last_date[slot]:
+            raise ValueError(f"{kind} of {symbol} on {trade_date} predates its latest transaction")
+        held = self.shares[slot]
+        if kind == "buy":
+            if held <= 0:
+                self.first_date[slot] = ordinal
+            self.shares[slot] = held + shares
+            self.cost_basis[slot] += shares * price
+            self.lots[slot] += 1
+        elif kind == "sell":
+            if shares > held + 1e-9:
+                raise ValueError(f"Cannot sell {shares} {symbol} on {trade_date}: only {held} held")
+            avg_cost = self.cost_basis[slot] / held
+            self.realized_gain[slot] += shares * (price - avg_cost)
+            remaining = held - shares
+            if remaining <= 1e-9:
+                self.shares[slot] = self.cost_basis[slot] = 0.0
+                self.lots[slot] = self.first_date[slot] = 0
+            else:
+                self.shares[slot] = remaining
+                self.cost_basis[slot] = remaining * avg_cost
+        elif kind == "split":
+            self.shares[slot] = held * ratio
+        elif kind == "dividend":
+            self.dividends[slot] += amount
+        else:
+            raise ValueError(f"Unknown transaction type {kind!r}")
+        self.last_date[slot] = max(self.last_date[slot], ordinal)
+
+    def last_transaction_date(self, symbol):
+        """Return the ISO date of the latest transaction for symbol, or '' if none."""
+        slot = self.slots.get(symbol)
+        return date.fromordinal(self.last_date[slot]).isoformat() if slot is not None and self.last_date[slot] else ""
+
+    def holding(self, symbol):
+        """Return the Holding for symbol, or None if it has no transactions."""
+        slot = self.slots.get(symbol)
+        if slot is None:
+            return None
+        shares = self.shares[slot]
+        return Holding(symbol, shares, self.cost_basis[slot], self.cost_basis[slot] / shares if shares > 0 else 0.0,
+                       date.fromordinal(self.first_date[slot]).isoformat() if self.first_date[slot] else None,
+                       self.realized_gain[slot], self.dividends[slot], self.lots[slot])
+
+    def holdings(self):
+        """Yield the Holding of every symbol."""
+        for symbol in self.symbols:
+            yield self.holding(symbol)
+
+    def totals(self):
+        """Return (total cost basis, total realized gain, total dividends) across all symbols."""
+        return tuple(float(np.frombuffer(getattr(self, column), dtype=np.float64).sum()) if len(self) else 0.0
+                     for column in ("cost_basis", "realized_gain", "dividends"))
+
+    def _slot(self, symbol):
+        slot = self.slots.get(symbol)
+        if slot is None:
+            slot = self.slots[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            for column in COLUMNS:
+                getattr(self, column).append(0.0)
+            self.lots.append(0)
+            self.first_date.append(0)
+            self.last_date.append(0)
+        return slot
@@ -0,0 +1,182 @@
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from instrumentation import metrics
+from market_data import ProviderError
+
+logger = logging.getLogger()
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to stay under a provider's request rate."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)  # Tokens added per second
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RefreshCancelled(Exception):
+    """Raised for symbols a cancelled run skips; not a refresh failure."""
+
+
+def retry_with_backoff(func, *args, retries=3, base_delay=0.5, max_delay=8.0, cancel_event=None):
+    """Call func(*args), retrying with jittered exponential backoff on any exception but ProviderError.
+
+    A ProviderError means every provider in a chain already failed, after the HTTP
+    transport retried 429/5xx responses, or had its circuit open; retrying it here
+    would multiply provider requests and defeat the circuit breakers.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except ProviderError:
+            raise
+        except Exception:
+            if attempt == retries or (cancel_event and cancel_event.is_set()):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+            time.sleep(delay)
+
+
+@metrics.timed("download_closes")
+def download_closes(symbols, period="1mo", chunk_size=100):
+    """Download the latest close for many symbols with batched yfinance requests."""
+    import yfinance as yf  # Deferred: importing yfinance (and pandas) costs most of a second
+    closes = {}
+    for start in range(0, len(symbols), chunk_size):
+        chunk = symbols[start:start + chunk_size]
+        data = yf.download(chunk, period=period, group_by="ticker", threads=True, progress=False)
+        if data is None or data.empty:
+            continue
+        for symbol in chunk:
+            try:
+                series = data[symbol]["Close"] if data.columns.nlevels > 1 else data["Close"]
+                series = series.dropna()
+                if not series.empty:
+                    closes[symbol] = float(series.iloc[-1])
+            except KeyError:
+                continue
+    return closes
+
+
+class RefreshEngine:
+    """Refresh quotes for many symbols concurrently, off the UI thread.
+
+    Prices are downloaded in batches, then per-symbol fundamentals are fetched on a
+    bounded worker pool. Each finished symbol is put on ``results`` as
+    ``("result", symbol, data)`` or ``("error", symbol, message)``, followed by a
+    single ``("done", None, None)`` once the run completes. Symbols skipped by a
+    cancelled run get no message. The UI drains the queue
+    from its own thread.
+    """
+
+    def __init__(self, fetch_fundamentals, max_workers=8, retries=3, backoff=0.5):
+        self.fetch_fundamentals = fetch_fundamentals  # Callable(symbol, price) -> (price, name, eps_ttm, eps_cagr, intrinsic_value)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.results = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def is_running(self):
+        """Return True while a refresh run is in progress."""
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, symbols, closes=None, fetch=None):
+        """Start refreshing symbols in a background thread, in the given order.
+
+        closes, if given, maps symbol to an already downloaded price and skips the
+        batched price download. fetch, if given, replaces fetch_fundamentals for
+        this run.
+        """
+        if self.is_running():
+            logger.warning("Refresh already in progress, ignoring new request")
+            return False
+        self.cancel_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(list(symbols), closes, fetch or self.fetch_fundamentals), daemon=True)
+        self.thread.start()
+        return True
+
+    def cancel(self):
+        """Ask the current run to stop after in-flight symbols finish."""
+        self.cancel_event.set()
+
+    def join(self, timeout=None):
+        """Wait for the run thread to exit; it does right after queueing "done"."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def drain(self):
+        """Return all messages currently waiting on the results queue."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.results.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _run(self, symbols, closes, fetch):
+        started = time.monotonic()
+        cancelled = 0
+        try:
+            if closes is None:
+                closes = self.download(symbols)
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._fetch_symbol, fetch, symbol, closes.get(symbol)): symbol
+                    for symbol in symbols
+                }
+                for future in as_completed(futures):
+                    symbol = futures[future]
+                    try:
+                        self.results.put(("result", symbol, future.result()))
+                    except RefreshCancelled:
+                        cancelled += 1
+                    except Exception as e:
+                        logger.error("Failed to refresh data for %s: %s", symbol, e)
+                        self.results.put(("error", symbol, str(e)))
+        finally:
+            metrics.observe("refresh_run", time.monotonic() - started)
+            if cancelled:
+                logger.info("Refresh cancelled, skipped %s of %s symbols", cancelled, len(symbols))
+            logger.info("Refresh of %s symbols finished in %.2fs", len(symbols), time.monotonic() - started)
+            self.results.put(("done", None, None))
+
+    def download(self, symbols):
+        """Download latest closes for symbols in batches, returning {} if the download keeps failing."""
+        try:
+            closes = retry_with_backoff(download_closes, symbols, retries=self.retries,
+                                        base_delay=self.backoff, cancel_event=self.cancel_event)
+        except Exception as e:
+            logger.error("Batched price download failed, falling back to per-symbol history: %s", e)
+            return {}
+        logger.debug("Batched download returned %d/%d prices", len(closes), len(symbols))
+        return closes
+
+    def _fetch_symbol(self, fetch, symbol, price):
+        if self.cancel_event.is_set():
+            raise RefreshCancelled(symbol)
+        return retry_with_backoff(fetch, symbol, price, retries=self.retries,
+                                  base_delay=self.backoff, cancel_event=self.cancel_event)
@@ -0,0 +1,129 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from benchmark_store import BENCHMARKS
+from instrumentation import metrics
+
+TRADING_DAYS = 252
+
+RiskReport = namedtuple("RiskReport", [
+    "start", "end", "days", "twr", "annualized_return", "max_drawdown", "drawdown_peak", "drawdown_trough",
+    "volatility", "sharpe", "risk_free_rate", "window", "rolling_volatility", "benchmarks",
+])
+BenchmarkRisk = namedtuple("BenchmarkRisk", ["ticker", "beta", "correlation", "days"])
+
+
+def daily_returns(values, flows):
+    """Return each day's return on the previous day's value, excluding that day's external cash flow."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = np.where(values[:-1] > 0, (values[1:] - flows[1:]) / values[:-1] - 1, 0.0)
+    return np.nan_to_num(returns)
+
+
+def max_drawdown(wealth):
+    """Return (drawdown, peak index, trough index) of the deepest peak-to-trough fall in a wealth index."""
+    drawdowns = wealth / np.maximum.accumulate(wealth) - 1
+    trough = int(np.argmin(drawdowns))
+    return float(drawdowns[trough]), int(np.argmax(wealth[:trough + 1])), trough
+
+
+def rolling_std(returns, window):
+    """Sample standard deviation over every window of returns in O(n), from running sums."""
+    if len(returns) < window or window < 2:
+        return np.array([])
+    centered = returns - returns.mean()  # Keeps the running sums small, avoiding cancellation
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    s1 = sums[window:] - sums[:-window]
+    s2 = squares[window:] - squares[:-window]
+    return np.sqrt(np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0))
+
+
+def beta_correlation(returns, benchmark_returns):
+    """Return (beta, correlation) of returns against benchmark_returns."""
+    covariance = np.cov(returns, benchmark_returns)
+    if covariance[1, 1] <= 0 or covariance[0, 0] <= 0:
+        return None, None
+    return float(covariance[0, 1] / covariance[1, 1]), float(covariance[0, 1] / np.sqrt(covariance[0, 0] * covariance[1, 1]))
+
+
+class RiskAnalytics:
+    """Time-weighted return, drawdown, volatility, Sharpe ratio and benchmark beta over the daily history.
+
+    Returns are time-weighted: buys and sells from the transaction log are
+    treated as external cash flows on the first history day on or after their
+    trade date, so adding money does not count as performance. Beta and
+    correlation use the stored benchmark closes on the days both series have.
+    Reports are cached until the history, the transaction log or the benchmark
+    closes change.
+    """
+
+    def __init__(self, history, transactions, prices, risk_free_rate=0.0, window=21, benchmarks=BENCHMARKS):
+        self.history = history
+        self.transactions = transactions
+        self.prices = prices  # BenchmarkStore
+        self.risk_free_rate = risk_free_rate  # Annual
+        self.window = window  # Trading days per rolling volatility window
+        self.benchmarks = benchmarks
+        self.cached = (None, None)  # (version key, RiskReport)
+        self.lock = threading.Lock()
+
+    def report(self):
+        """Return the RiskReport for the current history, or None with fewer than two days."""
+        with self.lock:
+            key = (self.history.version(), self.transactions.version(), self.prices.version(list(self.benchmarks.values())))
+            if self.cached[0] == key:
+                metrics.increment("cache_requests", cache="risk", endpoint="report", result="hit")
+                return self.cached[1]
+            metrics.increment("cache_requests", cache="risk", endpoint="report", result="miss")
+            with metrics.span("risk_report"):
+                report = self._compute()
+            self.cached = (key, report)
+            return report
+
+    def _compute(self):
+        rows = self.history.all()
+        if len(rows) < 2:
+            return None
+        dates, values = zip(*rows)
+        dates = np.array(dates)
+        values = np.array(values, dtype=float)
+
+        flows = np.zeros(len(dates))
+        for transaction in self.transactions.all():
+            if transaction.kind not in ("buy", "sell"):
+                continue
+            day = np.searchsorted(dates, transaction.trade_date)
+            if day < len(dates):
+                flows[day] += transaction.shares * transaction.price * (1 if transaction.kind == "buy" else -1)
+
+        returns = daily_returns(values, flows)
+        wealth = np.concatenate(([1.0], np.cumprod(1 + returns)))  # Growth of $1 since dates[0]
+        twr = float(wealth[-1] - 1)
+        years = len(returns) / TRADING_DAYS
+        annualized = float(wealth[-1] ** (1 / years) - 1) if years >= 1 and wealth[-1] > 0 else None  # Not extrapolated from under a year
+        drawdown, peak, trough = max_drawdown(wealth)
+
+        rolling = rolling_std(returns, self.window) * np.sqrt(TRADING_DAYS)
+        deviation = returns.std(ddof=1) if len(returns) > 1 else 0.0
+        volatility = float(rolling[-1]) if len(rolling) else float(deviation * np.sqrt(TRADING_DAYS)) if deviation else None
+        sharpe = (float((returns.mean() - self.risk_free_rate / TRADING_DAYS) / deviation * np.sqrt(TRADING_DAYS))
+                  if deviation > 0 else None)
+
+        benchmarks = {}
+        for name, ticker in self.benchmarks.items():
+            benchmark_dates, closes = self.prices.series(ticker)
+            _, ours, theirs = np.intersect1d(dates, np.array(benchmark_dates), assume_unique=True, return_indices=True)
+            if len(ours) < 3:
+                continue
+            beta, correlation = beta_correlation(wealth[ours][1:] / wealth[ours][:-1] - 1,
+                                                 closes[theirs][1:] / closes[theirs][:-1] - 1)
+            benchmarks[name] = BenchmarkRisk(ticker, beta, correlation, len(ours))
+
+        return RiskReport(
+            str(dates[0]), str(dates[-1]), len(returns), twr, annualized, drawdown, str(dates[peak]), str(dates[trough]),
+            volatility, sharpe, self.risk_free_rate, self.window,
+            (dates[self.window:].tolist(), rolling.tolist()), benchmarks,
+        )
@@ -0,0 +1,79 @@
+import logging
+import time
+from datetime import datetime, time as clock_time
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger()
+
+PRICES, FUNDAMENTALS, MACRO = "prices", "fundamentals", "macro"
+PRIORITY = {PRICES: 0, FUNDAMENTALS: 1}  # A refresh job supersedes a running one of lower priority
+
+
+class MarketHours:
+    """Regular trading session of a stock exchange (default NYSE/NASDAQ, holidays not included)."""
+
+    def __init__(self, timezone="America/New_York", opens=clock_time(9, 30), closes=clock_time(16, 0)):
+        self.timezone = ZoneInfo(timezone)
+        self.opens = opens
+        self.closes = closes
+
+    def is_open(self, now=None):
+        """Return True during the session on a weekday."""
+        local = (now or datetime.now(self.timezone)).astimezone(self.timezone)
+        return local.weekday() < 5 and self.opens <= local.time() < self.closes
+
+
+def prioritize(positions, last_updated, near=0.1):
+    """Order symbols for refreshing: alert-near positions first, then the stalest quotes.
+
+    positions are storage.Position rows; last_updated maps symbol to its last quote
+    timestamp (missing or None sorts first). A position is alert-near when its
+    price is within ``near`` of its alert threshold.
+    """
+    def key(position):
+        threshold = position.alert_threshold
+        distance = abs(position.price - threshold) / threshold if position.price and threshold else float("inf")
+        return (distance > near, distance if distance <= near else 0, last_updated.get(position.symbol) or "")
+    return [position.symbol for position in sorted(positions, key=key)]
+
+
+class RefreshScheduler:
+    """Decide which background refresh jobs are due.
+
+    Prices are refreshed every ``price_interval`` seconds while the market is open
+    and every ``closed_interval`` outside the session. Fundamentals (a full
+    refresh through the provider chains) and the AAA yield run on their own,
+    slower intervals. The scheduler only keeps time; the caller starts jobs,
+    reports them with ``started`` and makes sure only one refresh runs at a time.
+    """
+
+    def __init__(self, price_interval=300, closed_interval=3600, fundamentals_interval=86400, macro_interval=21600,
+                 market_hours=None, clock=time.monotonic):
+        self.intervals = {FUNDAMENTALS: fundamentals_interval, MACRO: macro_interval}
+        self.price_interval = price_interval
+        self.closed_interval = closed_interval
+        self.market_hours = market_hours or MarketHours()
+        self.clock = clock
+        self.last_run = {}  # job -> clock time it last started
+
+    def interval(self, job):
+        """Return the current interval of job in seconds."""
+        if job == PRICES:
+            return self.price_interval if self.market_hours.is_open() else self.closed_interval
+        return self.intervals[job]
+
+    def due(self):
+        """Return the jobs whose interval has elapsed, the most thorough refresh first."""
+        now = self.clock()
+        jobs = [job for job in (FUNDAMENTALS, PRICES, MACRO) if now - self.last_run.get(job, float("-inf")) >= self.interval(job)]
+        if FUNDAMENTALS in jobs and PRICES in jobs:
+            jobs.remove(PRICES)  # A full refresh fetches prices too
+        return jobs
+
+    def started(self, job):
+        """Record that job started now; a fundamentals refresh also counts as a price refresh."""
+        now = self.clock()
+        self.last_run[job] = now
+        if job == FUNDAMENTALS:
+            self.last_run[PRICES] = now
+        logger.debug("Started scheduled %s job, next in %ss", job, self.interval(job))
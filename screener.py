@@ -0,0 +1,136 @@
+import csv
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from instrumentation import metrics
+from refresh_engine import RefreshEngine
+
+logger = logging.getLogger()
+
+ScreenResult = namedtuple("ScreenResult", ["rank", "symbol", "company_name", "price", "eps_ttm", "eps_cagr",
+                                           "intrinsic_value", "margin_of_safety", "screened_at"])
+StoredRow = namedtuple("StoredRow", ["company_name", "price", "eps_ttm", "eps_cagr", "aaa_yield", "fundamentals_at"])
+
+
+def read_watchlist(path):
+    """Read tickers from a CSV with a symbol column, or a plain list with one per line; duplicates are dropped."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    if rows and "symbol" in [cell.strip().lower() for cell in rows[0]]:
+        column = [cell.strip().lower() for cell in rows[0]].index("symbol")
+        tickers = [row[column] for row in rows[1:] if len(row) > column]
+    else:
+        tickers = [row[0] for row in rows if row]
+    return list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip() and not ticker.startswith("#")))
+
+
+def margin_of_safety(intrinsic_value, price):
+    """Percent by which intrinsic value exceeds price, or None without a positive intrinsic value."""
+    if not intrinsic_value or intrinsic_value <= 0 or not price:
+        return None
+    return (intrinsic_value - price) / intrinsic_value * 100
+
+
+class Screener:
+    """Rank a watchlist by Graham margin of safety, persisted in ``screen_results``.
+
+    Each run downloads latest closes for the whole watchlist in batched requests.
+    Fundamentals go through the same cached, rate-limited provider chains as a
+    portfolio refresh, on their own worker pool, but only for symbols that are
+    new, have no batched price or whose stored fundamentals are older than
+    ``max_age``. Every other symbol is re-valued from its stored EPS figures, and
+    only if its price or the AAA yield moved; unchanged rows are not rewritten.
+    """
+
+    UPSERT = """
+        INSERT INTO screen_results (symbol, company_name, price, eps_ttm, eps_cagr, aaa_yield, intrinsic_value,
+                                    margin_of_safety, fundamentals_at, screened_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol) DO UPDATE SET
+            company_name = excluded.company_name, price = excluded.price, eps_ttm = excluded.eps_ttm,
+            eps_cagr = excluded.eps_cagr, aaa_yield = excluded.aaa_yield, intrinsic_value = excluded.intrinsic_value,
+            margin_of_safety = excluded.margin_of_safety, fundamentals_at = excluded.fundamentals_at,
+            screened_at = excluded.screened_at
+    """
+    RANKED = "SELECT symbol FROM screen_results ORDER BY margin_of_safety IS NULL, margin_of_safety DESC, symbol"
+
+    def __init__(self, db, fetch_refresh_data, graham_value, aaa_yield, max_workers=8, max_age=timedelta(days=7)):
+        self.db = db
+        self.refresh_engine = RefreshEngine(fetch_refresh_data, max_workers=max_workers)
+        self.graham_value = graham_value  # Callable(eps_ttm, eps_cagr) -> intrinsic value or None
+        self.aaa_yield = aaa_yield  # Callable() -> current AAA yield
+        self.max_age = max_age
+
+    @metrics.timed("screen_run")
+    def run(self, symbols, full=False):
+        """Screen symbols, re-fetching every symbol's fundamentals if full. Returns a summary dict.
+
+        Rows of symbols no longer on the watchlist are removed.
+        """
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        stored = self._stored()
+        aaa_yield = self.aaa_yield()
+        closes = self.refresh_engine.download(symbols)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cutoff = (datetime.now() - self.max_age).strftime("%Y-%m-%d %H:%M:%S")
+
+        rows, unchanged, stale = [], 0, []
+        for symbol in symbols:
+            row = stored.get(symbol)
+            price = closes.get(symbol)
+            if full or row is None or price is None or (row.fundamentals_at or "") < cutoff:
+                stale.append(symbol)
+            elif price == row.price and aaa_yield == row.aaa_yield:
+                unchanged += 1
+            else:
+                intrinsic_value = self.graham_value(row.eps_ttm, row.eps_cagr) if row.eps_ttm and row.eps_cagr else None
+                rows.append((symbol, row.company_name, price, row.eps_ttm, row.eps_cagr, aaa_yield, intrinsic_value,
+                             margin_of_safety(intrinsic_value, price), row.fundamentals_at, now))
+        revalued = len(rows)
+
+        failed = {}
+        if stale and self.refresh_engine.start(stale, closes):
+            logger.info("Screening: fetching fundamentals for %s of %s symbols", len(stale), len(symbols))
+            while True:
+                kind, symbol, data = self.refresh_engine.results.get()
+                if kind == "done":
+                    break
+                if kind == "error":
+                    failed[symbol] = data
+                    continue
+                price, name, eps_ttm, eps_cagr, intrinsic_value = data
+                rows.append((symbol, name, price, eps_ttm, eps_cagr, aaa_yield, intrinsic_value,
+                             margin_of_safety(intrinsic_value, price), now, now))
+
+        removed = [(symbol,) for symbol in stored.keys() - set(symbols)]
+        with self.db.transaction() as conn:
+            conn.executemany(self.UPSERT, rows)
+            conn.executemany("DELETE FROM screen_results WHERE symbol = ?", removed)
+            ranked = [(rank, symbol) for rank, (symbol,) in enumerate(conn.execute(self.RANKED).fetchall(), 1)]
+            conn.executemany("UPDATE screen_results SET rank = ? WHERE symbol = ?", ranked)
+        logger.info("Screened %s symbols: %s fetched, %s re-valued, %s unchanged, %s failed",
+                    len(symbols), len(rows) - revalued, revalued, unchanged, len(failed))
+        return {"screened": len(symbols), "fetched": len(rows) - revalued, "revalued": revalued,
+                "unchanged": unchanged, "removed": len(removed), "failed": failed}
+
+    def results(self, limit=None):
+        """Return stored ScreenResults in rank order, best margin of safety first."""
+        query = """
+            SELECT rank, symbol, company_name, price, eps_ttm, eps_cagr, intrinsic_value, margin_of_safety, screened_at
+            FROM screen_results ORDER BY rank
+        """
+        with self.db.connection() as conn:
+            rows = conn.execute(query + (" LIMIT ?" if limit else ""), (limit,) if limit else ()).fetchall()
+        return [ScreenResult(*row) for row in rows]
+
+    def cancel(self):
+        """Stop fetching after in-flight symbols finish."""
+        self.refresh_engine.cancel()
+
+    def _stored(self):
+        with self.db.connection() as conn:
+            rows = conn.execute("""
+                SELECT symbol, company_name, price, eps_ttm, eps_cagr, aaa_yield, fundamentals_at FROM screen_results
+            """).fetchall()
+        return {row[0]: StoredRow(*row[1:]) for row in rows}
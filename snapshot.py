@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+from instrumentation import metrics
+from storage import HistoryRepository, migrate_lots
+
+logger = logging.getLogger()
+
+FORMAT = "portfolio-snapshot"
+VERSION = 1
+SUFFIX = ".ptsnap"
+
+
+def _tables(conn):
+    """Return {table: [column, ...]} for every user table, in schema order."""
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid")]
+    return {name: [column[1] for column in conn.execute(f'PRAGMA table_info("{name}")')] for name in names}
+
+
+def _quoted(names):
+    return ", ".join(f'"{name}"' for name in names)
+
+
+def encode_column(values):
+    """Return (encoding, {member suffix: bytes}) for one column of SQLite values.
+
+    Numbers are stored as little-endian int64 or float64 arrays with a packed null
+    bitmap when needed; text is dictionary encoded as UTF-8 values with offsets
+    and int32 codes, where -1 is NULL.
+    """
+    kinds = {type(value) for value in values} - {type(None)}
+    nulls = [value is None for value in values]
+    if not kinds:
+        return "null", {}
+    if kinds <= {int, float}:
+        dtype = "<i8" if kinds == {int} else "<f8"
+        array = np.array([0 if value is None else value for value in values], dtype=dtype)
+        members = {"values": array.tobytes()}
+        if any(nulls):
+            members["nulls"] = np.packbits(np.array(nulls, dtype=bool)).tobytes()
+        return ("int" if dtype == "<i8" else "float"), members
+    if kinds == {str}:
+        codes = {}
+        for value in values:
+            if value is not None:
+                codes.setdefault(value, len(codes))
+        encoded = [value.encode("utf-8") for value in codes]
+        offsets = np.cumsum([0] + [len(value) for value in encoded], dtype="<i8")
+        return "text", {
+            "values": b"".join(encoded),
+            "offsets": offsets.tobytes(),
+            "codes": np.array([-1 if value is None else codes[value] for value in values], dtype="<i4").tobytes(),
+        }
+    return "json", {"values": json.dumps(values).encode("utf-8")}  # Mixed types in an untyped column
+
+
+def decode_column(encoding, members, rows):
+    """Return the list of values for one column written by encode_column."""
+    if encoding == "null":
+        return [None] * rows
+    if encoding in ("int", "float"):
+        values = np.frombuffer(members["values"], dtype="<i8" if encoding == "int" else "<f8").tolist()
+        if "nulls" in members:
+            nulls = np.unpackbits(np.frombuffer(members["nulls"], dtype=np.uint8), count=rows).astype(bool)
+            for i in np.flatnonzero(nulls).tolist():
+                values[i] = None
+        return values
+    if encoding == "text":
+        blob = members["values"]
+        offsets = np.frombuffer(members["offsets"], dtype="<i8").tolist()
+        strings = [blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+        lookup = np.array(strings + [None], dtype=object)  # Code -1 picks the trailing None
+        return lookup[np.frombuffer(members["codes"], dtype="<i4")].tolist()
+    if encoding == "json":
+        return json.loads(members["values"])
+    raise ValueError(f"Unknown column encoding {encoding!r}")
+
+
+@metrics.timed("snapshot", action="write")
+def write_snapshot(db, path):
+    """Write a consistent snapshot of every table in db to path. Returns {table: rows}.
+
+    The live database is first copied with SQLite's online backup API, so writers
+    are never blocked and every table comes from the same instant. The copy is
+    then written column by column into a deflated zip with a JSON manifest.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, copy_path = tempfile.mkstemp(suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        copy = sqlite3.connect(copy_path)
+        try:
+            with db.connection() as conn:
+                conn.backup(copy)
+            manifest = {"format": FORMAT, "version": VERSION, "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "tables": {}}
+            partial = path + ".partial"
+            with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+                for table, columns in _tables(copy).items():
+                    rows = copy.execute(f'SELECT {_quoted(columns)} FROM "{table}"').fetchall()
+                    encodings = {}
+                    for column, values in zip(columns, zip(*rows) if rows else [()] * len(columns)):
+                        encoding, members = encode_column(list(values))
+                        encodings[column] = encoding
+                        for suffix, data in members.items():
+                            archive.writestr(f"{table}/{column}.{suffix}", data)
+                    manifest["tables"][table] = {"rows": len(rows), "columns": encodings}
+                archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+            os.replace(partial, path)
+        finally:
+            copy.close()
+    finally:
+        os.remove(copy_path)
+    counts = {table: info["rows"] for table, info in manifest["tables"].items()}
+    logger.info("Wrote snapshot %s with %s rows in %s tables", path, sum(counts.values()), len(counts))
+    return counts
+
+
+def read_manifest(path):
+    """Return the manifest of a snapshot file, raising ValueError if it is not one."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read("manifest.json"))
+    except (zipfile.BadZipFile, KeyError, json.JSONDecodeError):
+        raise ValueError(f"{path} is not a portfolio snapshot")
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a portfolio snapshot")
+    if manifest.get("version", 0) > VERSION:
+        raise ValueError(f"Snapshot version {manifest['version']} is newer than this app supports ({VERSION})")
+    return manifest
+
+
+@metrics.timed("snapshot", action="restore")
+def restore_snapshot(db, path):
+    """Replace the contents of db with a snapshot in one transaction. Returns {table: rows}.
+
+    Tables and columns are matched by name against the current schema: columns
+    the snapshot predates keep their defaults, and tables it does not cover are
+    emptied (then rebuilt the way init_schema would, where derived).
+    """
+    manifest = read_manifest(path)
+    loaded = {}
+    with zipfile.ZipFile(path) as archive:
+        members = {}  # "table/column" -> {suffix: member name}
+        for name in archive.namelist():
+            key, _, suffix = name.rpartition(".")
+            members.setdefault(key, {})[suffix] = name
+        with db.transaction() as conn:
+            current = _tables(conn)
+            for table in current:
+                conn.execute(f'DELETE FROM "{table}"')
+            for table, info in manifest["tables"].items():
+                if table not in current:
+                    logger.warning("Skipping table %s from snapshot, not in this schema", table)
+                    continue
+                columns = [column for column in info["columns"] if column in current[table]]
+                data = [decode_column(info["columns"][column], {
+                    suffix: archive.read(name) for suffix, name in members.get(f"{table}/{column}", {}).items()
+                }, info["rows"]) for column in columns]
+                if columns and info["rows"]:
+                    conn.executemany(
+                        f'INSERT INTO "{table}" ({_quoted(columns)}) '
+                        f'VALUES ({", ".join("?" * len(columns))})', zip(*data))
+                loaded[table] = info["rows"]
+            migrate_lots(conn)
+            if "portfolio_history_weekly" not in manifest["tables"]:
+                conn.execute(HistoryRepository.REBUILD_WEEKLY)
+    logger.info("Restored snapshot %s from %s: %s rows in %s tables", path, manifest["created_at"], sum(loaded.values()), len(loaded))
+    return loaded
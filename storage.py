@@ -0,0 +1,592 @@
+import csv
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+
+from instrumentation import metrics
+
+logger = logging.getLogger()
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # Readers never block the writer and vice versa
+    "PRAGMA synchronous=NORMAL",  # Safe with WAL, avoids an fsync per commit
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # 16 MB page cache
+    "PRAGMA mmap_size=67108864",
+)
+
+HISTORY_TABLE = """
+    CREATE TABLE IF NOT EXISTS portfolio_history (
+        date TEXT PRIMARY KEY,
+        total_value REAL
+    ) WITHOUT ROWID
+"""
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS portfolio (
+        symbol TEXT PRIMARY KEY,
+        company_name TEXT,
+        purchase_date TEXT,
+        purchase_price REAL,
+        shares REAL,
+        price REAL,
+        eps_ttm REAL,
+        eps_cagr REAL,
+        intrinsic_value REAL,
+        alert_threshold REAL,
+        last_updated TEXT
+    )
+    """,
+    HISTORY_TABLE,
+    """
+    CREATE TABLE IF NOT EXISTS portfolio_history_intraday (
+        ts TEXT PRIMARY KEY,
+        total_value REAL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS portfolio_history_weekly (
+        week TEXT PRIMARY KEY,
+        total_value REAL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS macro_series (
+        series_id TEXT PRIMARY KEY,
+        value REAL,
+        observation_date TEXT,
+        fetched_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS fundamentals_cache (
+        symbol TEXT,
+        endpoint TEXT,
+        payload TEXT,
+        fetched_at TEXT,
+        expires_at TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        PRIMARY KEY (symbol, endpoint)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol TEXT,
+        price REAL,
+        threshold REAL,
+        fired_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_alerts_symbol_fired_at ON alerts (symbol, fired_at)",
+    """
+    CREATE TABLE IF NOT EXISTS benchmark_prices (
+        ticker TEXT,
+        date TEXT,
+        close REAL,
+        PRIMARY KEY (ticker, date)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS benchmark_coverage (
+        ticker TEXT PRIMARY KEY,
+        start_date TEXT,
+        end_date TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol TEXT NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ('buy', 'sell', 'split', 'dividend')),
+        trade_date TEXT NOT NULL,
+        shares REAL,
+        price REAL,
+        ratio REAL,
+        amount REAL,
+        created_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_transactions_symbol_date ON transactions (symbol, trade_date)",
+    """
+    CREATE TABLE IF NOT EXISTS screen_results (
+        symbol TEXT PRIMARY KEY,
+        company_name TEXT,
+        price REAL,
+        eps_ttm REAL,
+        eps_cagr REAL,
+        aaa_yield REAL,
+        intrinsic_value REAL,
+        margin_of_safety REAL,
+        rank INTEGER,
+        fundamentals_at TEXT,
+        screened_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_screen_results_rank ON screen_results (rank)",
+    """
+    CREATE TABLE IF NOT EXISTS history_backfill (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        through_date TEXT,
+        transactions_version TEXT
+    )
+    """,
+)
+
+
+def migrate_history(conn):
+    """Collapse the original unkeyed portfolio_history table to one row per date (the last written)."""
+    columns = conn.execute("PRAGMA table_info(portfolio_history)").fetchall()
+    if not columns or any(column[5] for column in columns):  # Missing, or already has a primary key
+        return
+    logger.info("Migrating portfolio_history to one row per date")
+    conn.execute("ALTER TABLE portfolio_history RENAME TO portfolio_history_unkeyed")
+    conn.execute(HISTORY_TABLE)
+    conn.execute("""
+        INSERT INTO portfolio_history (date, total_value)
+        SELECT date, total_value FROM portfolio_history_unkeyed
+        WHERE rowid IN (SELECT MAX(rowid) FROM portfolio_history_unkeyed WHERE date IS NOT NULL GROUP BY date)
+    """)
+    conn.execute("DROP TABLE portfolio_history_unkeyed")
+
+
+def migrate_lots(conn):
+    """Seed an empty transaction log with one buy per stored position, for databases that predate lots.
+
+    Positions without a purchase price or an ISO purchase date cannot become a
+    buy. They are logged by symbol, because a later transaction for the symbol
+    rebuilds its row from the log alone and would drop the original lot.
+    """
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM transactions)").fetchone()[0]:
+        return
+    migratable = """
+        shares > 0 AND purchase_price IS NOT NULL AND COALESCE(purchase_date, '') GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    """
+    count = conn.execute(f"""
+        INSERT INTO transactions (symbol, kind, trade_date, shares, price, created_at)
+        SELECT symbol, 'buy', purchase_date, shares, purchase_price, last_updated FROM portfolio
+        WHERE {migratable}
+        ORDER BY purchase_date
+    """).rowcount
+    if count > 0:
+        logger.info("Migrated %s positions to buy transactions", count)
+    skipped = [row[0] for row in conn.execute(
+        f"SELECT symbol FROM portfolio WHERE shares > 0 AND NOT ({migratable}) ORDER BY symbol")]
+    if skipped:
+        logger.warning("Could not migrate %s positions without a purchase price or YYYY-MM-DD purchase date "
+                       "to transactions; import their purchases as transactions to keep them in holdings: %s", len(skipped), ", ".join(skipped))
+
+
+class Database:
+    """Long-lived SQLite connections for portfolio.db.
+
+    The thread that creates the Database (the Tk thread) reuses a single connection
+    for its whole lifetime. Background workers borrow connections from a small pool,
+    so refreshes and UI reads never share a connection object. All connections run in
+    WAL mode with the same tuned pragmas, and sqlite3's per-connection statement cache
+    keeps the repositories' fixed SQL prepared between calls.
+    """
+
+    def __init__(self, db_path, pool_size=4):
+        self.db_path = db_path
+        self.owner = threading.get_ident()
+        self.main = self._connect()
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Yield a connection for the calling thread."""
+        if threading.get_ident() == self.owner:
+            yield self.main
+            return
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self.pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Yield a connection inside a transaction that commits on success."""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def init_schema(self):
+        """Create all tables if they do not exist, migrating older layouts first."""
+        with self.transaction() as conn:
+            migrate_history(conn)
+            for statement in SCHEMA:
+                conn.execute(statement)
+            migrate_lots(conn)
+            if conn.execute("SELECT COUNT(*) FROM portfolio_history_weekly").fetchone()[0] == 0:
+                conn.execute(HistoryRepository.REBUILD_WEEKLY)
+
+    def close(self):
+        """Close the main connection and every pooled connection."""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self.main.close()
+
+
+class Position(NamedTuple):
+    """One row of the portfolio table."""
+
+    symbol: str
+    company_name: Optional[str]
+    purchase_date: Optional[str]
+    purchase_price: Optional[float]
+    shares: Optional[float]
+    price: Optional[float]
+    intrinsic_value: Optional[float]
+    alert_threshold: Optional[float]
+
+
+class Quote(NamedTuple):
+    """Freshly fetched market data for one symbol."""
+
+    symbol: str
+    price: float
+    company_name: Optional[str]
+    eps_ttm: Optional[float]
+    eps_cagr: Optional[float]
+    intrinsic_value: Optional[float]
+
+
+class Transaction(NamedTuple):
+    """One entry of the transaction log; unused fields are None (ratio for splits, amount for dividends)."""
+
+    symbol: str
+    kind: str
+    trade_date: str
+    shares: Optional[float] = None
+    price: Optional[float] = None
+    ratio: Optional[float] = None
+    amount: Optional[float] = None
+
+
+TRANSACTION_KINDS = ("buy", "sell", "split", "dividend")
+
+
+def check_transaction(transaction):
+    """Raise ValueError unless transaction has a known kind, an ISO date and the fields its kind needs."""
+    symbol, kind, trade_date, shares, price, ratio, amount = transaction
+    if not symbol:
+        raise ValueError("Transaction has no symbol")
+    if kind not in TRANSACTION_KINDS:
+        raise ValueError(f"Unknown transaction type {kind!r} for {symbol}")
+    try:
+        date.fromisoformat(trade_date)
+    except (TypeError, ValueError):
+        raise ValueError(f"Transaction date for {symbol} must be in YYYY-MM-DD format") from None
+    if kind in ("buy", "sell") and not (shares and shares > 0 and price is not None and price >= 0):
+        raise ValueError(f"A {kind} of {symbol} needs a positive share count and a price")
+    if kind == "split" and not (ratio and ratio > 0):
+        raise ValueError(f"A split of {symbol} needs a positive ratio")
+    if kind == "dividend" and amount is None:
+        raise ValueError(f"A dividend of {symbol} needs an amount")
+
+
+def _number(value):
+    return float(value.replace("$", "").replace(",", "")) if value else None
+
+
+def read_transactions_csv(path):
+    """Read transactions from a brokerage-style CSV export, one lot per row.
+
+    Requires symbol and date (or purchase_date) columns. An optional type column
+    holds buy (the default), sell, split or dividend; buys and sells need shares
+    and price (or purchase_price), splits a ratio and dividends an amount.
+    company_name and alert_threshold are optional. Returns (transactions, details,
+    skipped) where details maps symbol to (company_name, alert_threshold).
+    """
+    transactions = []
+    details = {}
+    skipped = 0
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+            try:
+                transaction = Transaction(
+                    row["symbol"].upper(), (row.get("type") or "buy").lower(), row.get("date") or row["purchase_date"],
+                    _number(row.get("shares")), _number(row.get("price") or row.get("purchase_price")),
+                    _number(row.get("ratio")), _number(row.get("amount")))
+                check_transaction(transaction)
+                alert_threshold = _number(row.get("alert_threshold"))
+            except (KeyError, ValueError):
+                skipped += 1
+                continue
+            transactions.append(transaction)
+            name, threshold = details.get(transaction.symbol, (None, None))
+            details[transaction.symbol] = (name or row.get("company_name") or None, alert_threshold or threshold)
+    if skipped:
+        logger.warning("Skipped %s invalid rows while reading %s", skipped, path)
+    return transactions, details, skipped
+
+
+class PositionRepository:
+    """Typed access to the portfolio table."""
+
+    SELECT_ALL = "SELECT symbol, company_name, purchase_date, purchase_price, shares, price, intrinsic_value, alert_threshold FROM portfolio"
+    UPDATE_QUOTE = """
+        UPDATE portfolio SET price = ?, company_name = ?, eps_ttm = ?, eps_cagr = ?, intrinsic_value = ?, last_updated = ?
+        WHERE symbol = ?
+    """
+    UPSERT_IMPORTED = """
+        INSERT INTO portfolio (symbol, company_name, purchase_date, purchase_price, shares, alert_threshold, last_updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol) DO UPDATE SET
+            company_name = COALESCE(excluded.company_name, company_name), purchase_date = excluded.purchase_date,
+            purchase_price = excluded.purchase_price, shares = excluded.shares,
+            alert_threshold = COALESCE(excluded.alert_threshold, alert_threshold), last_updated = excluded.last_updated
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @metrics.timed("db_query", query="positions.all")
+    def all(self):
+        """Return every position."""
+        with self.db.connection() as conn:
+            return [Position(*row) for row in conn.execute(self.SELECT_ALL)]
+
+    @metrics.timed("db_query", query="positions.update_quotes")
+    def update_quotes(self, quotes, last_updated):
+        """Update refreshed quotes with a single executemany in one transaction.
+
+        Only existing rows are updated: a quote for a symbol closed while its
+        refresh was in flight must not bring back a row without shares.
+        """
+        with self.db.transaction() as conn:
+            conn.executemany(self.UPDATE_QUOTE, [
+                (quote.price, quote.company_name, quote.eps_ttm, quote.eps_cagr, quote.intrinsic_value, last_updated, quote.symbol)
+                for quote in quotes
+            ])
+
+    @metrics.timed("db_query", query="positions.bulk_import")
+    def bulk_import(self, positions, last_updated):
+        """Upsert purchase details for many positions in one transaction, keeping cached quote data."""
+        with self.db.transaction() as conn:
+            conn.executemany(self.UPSERT_IMPORTED, [
+                (position.symbol, position.company_name, position.purchase_date, position.purchase_price,
+                 position.shares, position.alert_threshold, last_updated)
+                for position in positions
+            ])
+        return len(positions)
+
+    def quotes(self):
+        """Return {symbol: (company_name, eps_ttm, eps_cagr, intrinsic_value, last_updated)} for every position."""
+        with self.db.connection() as conn:
+            return {row[0]: row[1:] for row in conn.execute(
+                "SELECT symbol, company_name, eps_ttm, eps_cagr, intrinsic_value, last_updated FROM portfolio")}
+
+    def clear(self):
+        """Delete every position."""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM portfolio")
+
+
+class TransactionRepository:
+    """Typed access to the transactions table, the source of truth for holdings.
+
+    The portfolio table keeps one aggregate row per held symbol (total shares,
+    average cost, first purchase date) next to its cached quote; ``record``
+    writes new transactions and the aggregates they produce in one SQLite
+    transaction so the two never disagree.
+    """
+
+    INSERT = """
+        INSERT INTO transactions (symbol, kind, trade_date, shares, price, ratio, amount, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    SELECT = "SELECT symbol, kind, trade_date, shares, price, ratio, amount FROM transactions"
+    ORDER = " ORDER BY trade_date, id"
+    DELETE_POSITION = "DELETE FROM portfolio WHERE symbol = ?"
+    CHUNK = 500  # Stay under SQLite's bound-parameter limit
+
+    def __init__(self, db):
+        self.db = db
+
+    @metrics.timed("db_query", query="transactions.all")
+    def all(self):
+        """Return every transaction ordered by trade date, then insertion order."""
+        with self.db.connection() as conn:
+            return [Transaction(*row) for row in conn.execute(self.SELECT + self.ORDER)]
+
+    def for_symbols(self, symbols):
+        """Return the transactions of symbols ordered by trade date, then insertion order."""
+        symbols = list(symbols)
+        rows = []
+        with self.db.connection() as conn:
+            for i in range(0, len(symbols), self.CHUNK):
+                chunk = symbols[i:i + self.CHUNK]
+                query = self.SELECT + f" WHERE symbol IN ({','.join('?' * len(chunk))})" + self.ORDER
+                rows.extend(Transaction(*row) for row in conn.execute(query, chunk))
+        rows.sort(key=lambda transaction: transaction.trade_date)  # Stable, so insertion order survives across chunks
+        return rows
+
+    def version(self):
+        """Return a token that changes whenever transactions are added or cleared."""
+        with self.db.connection() as conn:
+            count, last_id = conn.execute("SELECT COUNT(*), MAX(id) FROM transactions").fetchone()
+        return f"{count}:{last_id}"
+
+    def unrecorded(self, transactions):
+        """Return the transactions not already in the log, counting repeats, so re-importing a file adds nothing."""
+        existing = Counter(self.for_symbols({transaction.symbol for transaction in transactions}))
+        new = []
+        for transaction in transactions:
+            if existing[transaction]:
+                existing[transaction] -= 1
+            else:
+                new.append(transaction)
+        return new
+
+    @metrics.timed("db_query", query="transactions.record")
+    def record(self, transactions, positions, closed, created_at):
+        """Append transactions, upsert the positions' aggregates and delete closed symbols' rows in one transaction."""
+        with self.db.transaction() as conn:
+            conn.executemany(self.INSERT, [(*transaction, created_at) for transaction in transactions])
+            conn.executemany(PositionRepository.UPSERT_IMPORTED, [
+                (position.symbol, position.company_name, position.purchase_date, position.purchase_price,
+                 position.shares, position.alert_threshold, created_at)
+                for position in positions
+            ])
+            conn.executemany(self.DELETE_POSITION, [(symbol,) for symbol in closed])
+
+    def clear(self):
+        """Delete every transaction."""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM transactions")
+
+
+class HistoryRepository:
+    """Portfolio value history kept at three resolutions.
+
+    Every recorded value is upserted into a 15-minute intraday bucket, its day and
+    its week (keyed by the Monday), so repeated saves within a bucket overwrite
+    instead of piling up and each tier holds the last value seen in its bucket.
+    Intraday buckets older than ``intraday_days`` are pruned. Queries pick the
+    finest tier that fits the caller's point budget and thin it further if needed.
+    """
+
+    UPSERT_INTRADAY = """
+        INSERT INTO portfolio_history_intraday (ts, total_value) VALUES (?, ?)
+        ON CONFLICT(ts) DO UPDATE SET total_value = excluded.total_value
+    """
+    UPSERT_DAILY = """
+        INSERT INTO portfolio_history (date, total_value) VALUES (?, ?)
+        ON CONFLICT(date) DO UPDATE SET total_value = excluded.total_value
+    """
+    UPSERT_WEEKLY = """
+        INSERT INTO portfolio_history_weekly (week, total_value) VALUES (date(?, '-6 days', 'weekday 1'), ?)
+        ON CONFLICT(week) DO UPDATE SET total_value = excluded.total_value
+    """
+    REBUILD_WEEKLY = """
+        INSERT OR REPLACE INTO portfolio_history_weekly (week, total_value)
+        SELECT date(date, '-6 days', 'weekday 1'), total_value FROM portfolio_history ORDER BY date
+    """
+    PRUNE_INTRADAY = "DELETE FROM portfolio_history_intraday WHERE ts < ?"
+    TIERS = {
+        "intraday": ("ts", "portfolio_history_intraday"),
+        "daily": ("date", "portfolio_history"),
+        "weekly": ("week", "portfolio_history_weekly"),
+    }
+
+    def __init__(self, db, bucket_minutes=15, intraday_days=30):
+        self.db = db
+        self.bucket_minutes = bucket_minutes
+        self.intraday_days = intraday_days
+
+    @metrics.timed("db_query", query="history.record")
+    def record(self, when, total_value):
+        """Record the total portfolio value at datetime when in every tier."""
+        bucket = when.replace(minute=when.minute - when.minute % self.bucket_minutes, second=0, microsecond=0)
+        date = when.strftime("%Y-%m-%d")
+        with self.db.transaction() as conn:
+            conn.execute(self.UPSERT_INTRADAY, (bucket.strftime("%Y-%m-%d %H:%M"), total_value))
+            conn.execute(self.UPSERT_DAILY, (date, total_value))
+            conn.execute(self.UPSERT_WEEKLY, (date, total_value))
+            conn.execute(self.PRUNE_INTRADAY, ((when - timedelta(days=self.intraday_days)).strftime("%Y-%m-%d %H:%M"),))
+
+    @metrics.timed("db_query", query="history.record_daily")
+    def record_daily(self, rows):
+        """Upsert date-sorted (date, total_value) rows into the daily and weekly tiers in one transaction."""
+        with self.db.transaction() as conn:
+            conn.executemany(self.UPSERT_DAILY, rows)
+            conn.executemany(self.UPSERT_WEEKLY, rows)
+
+    def version(self):
+        """Return a token that changes whenever the daily tier changes."""
+        with self.db.connection() as conn:
+            return conn.execute("SELECT COUNT(*), MAX(date), TOTAL(total_value) FROM portfolio_history").fetchone()
+
+    def span(self):
+        """Return (first, last) dates of the daily tier, or (None, None) when it is empty."""
+        with self.db.connection() as conn:
+            return conn.execute("SELECT MIN(date), MAX(date) FROM portfolio_history").fetchone()
+
+    def all(self):
+        """Return daily (date, total_value) rows ordered by date."""
+        return self.range("daily")
+
+    @metrics.timed("db_query", query="history.range")
+    def range(self, tier="daily", start=None, end=None):
+        """Return (key, total_value) rows for a tier, optionally limited to start <= key < end."""
+        key, table = self.TIERS[tier]
+        query = f"SELECT {key}, total_value FROM {table}"
+        conditions, params = [], []
+        if start:
+            conditions.append(f"{key} >= ?")
+            params.append(start)
+        if end:
+            conditions.append(f"{key} < ?")
+            params.append(end)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.db.connection() as conn:
+            return conn.execute(query + f" ORDER BY {key}", params).fetchall()
+
+    @metrics.timed("db_query", query="history.series")
+    def series(self, max_points, start=None, end=None):
+        """Return at most max_points (date, total_value) rows for charting.
+
+        Uses daily values when they fit, weekly ones otherwise, and finally keeps the
+        last row of each of max_points equal-sized buckets.
+        """
+        rows = self.range("daily", start, end)
+        if len(rows) > max_points:
+            rows = self.range("weekly", start, end)
+        if len(rows) <= max_points:
+            return rows
+        step = len(rows) / max_points
+        return [rows[min(len(rows) - 1, int((i + 1) * step) - 1)] for i in range(max_points)]
+
+    def clear(self):
+        """Delete all history."""
+        with self.db.transaction() as conn:
+            for key, table in self.TIERS.values():
+                conn.execute(f"DELETE FROM {table}")
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Modules are flat siblings in the repository root; keep their data out of the real home directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["HOME"] = tempfile.mkdtemp(prefix="portfolio-tests-")
+os.environ.setdefault("REFRESH_ON_START", "False")
@@ -0,0 +1,71 @@
+import os
+import sys
+from datetime import date, timedelta
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+from fake_providers import FakeYFinance, FaultProfile  # noqa: E402
+
+import portfolio_tracker  # noqa: E402
+from benchmark_store import last_close_date  # noqa: E402
+from portfolio_engine import PortfolioEngine  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    yfinance = FakeYFinance(FaultProfile())
+    monkeypatch.setitem(sys.modules, "yfinance", yfinance)
+    engine = PortfolioEngine(str(tmp_path))
+    engine.yfinance = yfinance
+    yield engine
+    engine.close()
+
+
+def test_last_close_date_skips_today_and_weekends():
+    assert last_close_date(date(2024, 6, 12)) == date(2024, 6, 11)  # Wednesday -> Tuesday
+    assert last_close_date(date(2024, 6, 17)) == date(2024, 6, 14)  # Monday -> Friday
+    assert last_close_date(date(2024, 6, 16)) == date(2024, 6, 14)  # Sunday -> Friday
+
+
+def test_update_benchmarks_downloads_once_until_another_session_closes(engine):
+    today = date.today()
+    engine.history.record_daily([((today - timedelta(days=days)).isoformat(), 1000.0) for days in (60, 0)])
+    with mock.patch.object(engine.yfinance, "download", wraps=engine.yfinance.download) as download:
+        engine.update_benchmarks()
+        assert download.call_count == 1
+        engine.benchmark_store.checked_at.clear()  # As if the hourly re-check were due
+        engine.update_benchmarks()
+        assert download.call_count == 1
+
+
+def test_update_chart_only_reads_stored_closes():
+    app = portfolio_tracker.PortfolioTrackerApp.__new__(portfolio_tracker.PortfolioTrackerApp)
+    app.engine = mock.MagicMock()
+    app.engine.history.series.return_value = [("2024-06-10", 1000.0), ("2024-06-11", 1010.0)]
+    app.chart_frame = mock.Mock(winfo_width=mock.Mock(return_value=800))
+    app.chart = mock.Mock()
+    app.update_chart()
+    app.engine.benchmark_store.update.assert_not_called()
+    app.chart.set_data.assert_called_once()
+
+
+def test_partially_failed_batch_leaves_missing_tickers_uncovered(engine):
+    store = engine.benchmark_store
+    download = engine.yfinance.download
+
+    def without_bad(tickers, **kwargs):
+        data = download(tickers, **kwargs)
+        return data.drop(columns="BAD", level=0)
+
+    with mock.patch.object(engine.yfinance, "download", side_effect=without_bad):
+        store.update(["GOOD", "BAD"], date(2024, 1, 1), date(2024, 3, 1))
+    assert set(store._coverage(["GOOD", "BAD"])) == {"GOOD"}
+    assert len(store.series("GOOD")[0]) > 0
+
+    with mock.patch.object(engine.yfinance, "download", wraps=download) as retry:
+        store.update(["GOOD", "BAD"], date(2024, 1, 1), date(2024, 3, 1))
+    assert retry.call_args.args[0] == ["BAD"]
+    assert set(store._coverage(["GOOD", "BAD"])) == {"GOOD", "BAD"}
+    assert len(store.series("BAD")[0]) > 0
@@ -0,0 +1,42 @@
+import pytest
+
+from portfolio_engine import PortfolioEngine
+from storage import Quote, Transaction
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = PortfolioEngine(str(tmp_path))
+    yield engine
+    engine.close()
+
+
+def test_update_quotes_skips_symbols_without_a_row(engine):
+    engine.positions.update_quotes([Quote("AAA", 10.0, "AAA Corp", 1.0, 0.05, 12.0)], "2024-01-02 00:00:00")
+    assert engine.positions.all() == []
+
+
+def test_refresh_result_after_selling_out_does_not_recreate_the_position(engine):
+    engine.record_transactions([Transaction("AAA", "buy", "2024-01-02", 10, 100.0)], {"AAA": ("AAA Corp", None)})
+    engine.record_transactions([Transaction("AAA", "sell", "2024-02-01", 10, 110.0)])
+    assert engine.positions.all() == []
+
+    frame = engine.apply_refresh({"AAA": (120.0, "AAA Corp", 1.0, 0.05, 15.0)})  # Started before the sell
+    assert engine.positions.all() == []
+    assert frame.totals().count == 0
+
+
+def test_refresh_updates_held_positions(engine):
+    engine.record_transactions([Transaction("AAA", "buy", "2024-01-02", 10, 100.0)], {"AAA": ("AAA Corp", None)})
+    engine.apply_refresh({"AAA": (120.0, "AAA Corp", 1.0, 0.05, 15.0)})
+    [position] = engine.positions.all()
+    assert (position.shares, position.purchase_price, position.price) == (10, 100.0, 120.0)
+
+
+def test_clear_waits_for_the_running_refresh(engine):
+    events = []
+    engine.refresh_engine.cancel = lambda: events.append("cancel")
+    engine.refresh_engine.join = lambda timeout=None: events.append("join")
+    engine.positions.clear = lambda: events.append("clear")
+    engine.clear()
+    assert events[:3] == ["cancel", "join", "clear"]
@@ -0,0 +1,55 @@
+import logging
+import threading
+
+import pytest
+
+from market_data import ProviderError
+from refresh_engine import RefreshEngine, retry_with_backoff
+
+
+def test_provider_errors_are_not_retried():
+    calls = []
+
+    def fetch(symbol):
+        calls.append(symbol)
+        raise ProviderError("No price available for AAA (fmp: circuit open)")
+
+    with pytest.raises(ProviderError):
+        retry_with_backoff(fetch, "AAA", retries=3, base_delay=0)
+    assert calls == ["AAA"]
+
+
+def test_other_errors_are_retried():
+    calls = []
+
+    def download(symbols):
+        calls.append(symbols)
+        if len(calls) < 3:
+            raise ConnectionError("reset")
+        return {"AAA": 1.0}
+
+    assert retry_with_backoff(download, ["AAA"], retries=3, base_delay=0) == {"AAA": 1.0}
+    assert len(calls) == 3
+
+
+def test_cancelled_run_skips_remaining_symbols_quietly(caplog):
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch(symbol, price):
+        started.set()
+        release.wait(5)
+        return price, symbol, None, None, None
+
+    engine = RefreshEngine(fetch, max_workers=1)
+    symbols = [f"S{i}" for i in range(5)]
+    with caplog.at_level(logging.INFO):
+        engine.start(symbols, closes={symbol: 1.0 for symbol in symbols})
+        started.wait(5)
+        engine.cancel()
+        release.set()
+        engine.join(5)
+    messages = engine.drain()
+    assert [kind for kind, _, _ in messages] == ["result", "done"]
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert "Refresh cancelled, skipped 4 of 5 symbols" in caplog.text
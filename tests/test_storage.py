@@ -0,0 +1,19 @@
+import logging
+
+from storage import Database, migrate_lots
+
+
+def test_migrate_lots_warns_about_positions_it_cannot_migrate(tmp_path, caplog):
+    db = Database(str(tmp_path / "legacy.db"))
+    db.init_schema()
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO portfolio (symbol, purchase_date, purchase_price, shares) VALUES (?, ?, ?, ?)", [
+            ("AAA", "2024-01-02", 10.0, 5), ("BBB", None, 10.0, 5), ("CCC", "01/02/2024", 10.0, 5), ("DDD", "2024-01-02", None, 5),
+        ])
+        conn.execute("DELETE FROM transactions")
+        with caplog.at_level(logging.INFO):
+            migrate_lots(conn)
+        assert [row[0] for row in conn.execute("SELECT symbol FROM transactions")] == ["AAA"]
+    db.close()
+    assert "Could not migrate 3 positions" in caplog.text
+    assert "BBB, CCC, DDD" in caplog.text
@@ -0,0 +1,106 @@
+from unittest import mock
+
+import pytest
+
+import portfolio_tracker
+from analytics import PortfolioTotals
+from scheduler import FUNDAMENTALS, MACRO, PRICES, RefreshScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def app():
+    """A PortfolioTrackerApp built by its real __init__ on a stubbed root, widgets and engine."""
+    engine = mock.MagicMock()
+    engine.refresh_on_start = False
+    engine.auto_refresh = True
+    engine.alert_engine.recent.return_value = []
+    engine.refresh_engine.is_running.return_value = False
+    engine.refresh_engine.drain.return_value = []
+    engine.risk_report.return_value = None
+    engine.apply_refresh.return_value.totals.return_value = PortfolioTotals(0, 0.0, 0.0, 0.0)
+    engine.load_snapshot.return_value = engine.apply_refresh.return_value
+    engine.scheduler = RefreshScheduler(market_hours=mock.Mock(is_open=mock.Mock(return_value=True)), clock=FakeClock())
+    with mock.patch.object(portfolio_tracker, "PortfolioEngine", return_value=engine), \
+            mock.patch.object(portfolio_tracker, "tk"), mock.patch.object(portfolio_tracker, "ttk"), \
+            mock.patch.object(portfolio_tracker, "PortfolioTreeView"):
+        app = portfolio_tracker.PortfolioTrackerApp(mock.MagicMock())
+    app.root.after.reset_mock()
+    return app
+
+
+def scheduled(app, callback):
+    return [call for call in app.root.after.call_args_list if call.args[1] == callback]
+
+
+def test_first_tick_runs_macro_job_and_reschedules(app):
+    app.run_scheduler()
+    assert app.macro_thread is not None
+    app.macro_thread.join(1)
+    app.engine.get_aaa_yield.assert_called_once()
+    assert scheduled(app, app.run_scheduler)
+
+
+def test_due_prices_job_starts_a_prices_only_refresh(app):
+    app.engine.positions.all.return_value = [mock.Mock(symbol="AAA")]
+    app.engine.refresh_order.return_value = ["AAA"]
+    app.engine.scheduler.clock.now = 301
+    app.run_scheduler()
+    app.engine.start_refresh.assert_called_once_with(["AAA"], prices_only=True)
+    assert app.refresh_job == PRICES
+    assert scheduled(app, app.run_scheduler)
+
+
+def test_finish_refresh_without_pending_job(app):
+    app.finish_refresh()
+    app.engine.apply_refresh.assert_called_once_with({})
+    app.engine.start_refresh.assert_not_called()
+
+
+def test_finish_refresh_starts_the_superseding_job(app):
+    app.engine.positions.all.return_value = [mock.Mock(symbol="AAA")]
+    app.engine.refresh_order.return_value = ["AAA"]
+    app.start_refresh(PRICES)
+    app.engine.refresh_engine.is_running.return_value = True
+    app.start_refresh(FUNDAMENTALS)
+    app.engine.refresh_engine.cancel.assert_called_once()
+    assert app.pending_job == FUNDAMENTALS
+
+    app.engine.refresh_engine.is_running.return_value = False
+    app.finish_refresh()
+    assert app.pending_job is None
+    assert app.refresh_job == FUNDAMENTALS
+    app.engine.start_refresh.assert_called_with(["AAA"], prices_only=False)
+
+
+def test_scheduler_reports_macro_due_until_started():
+    scheduler = RefreshScheduler(clock=FakeClock())
+    assert MACRO in scheduler.due()
+    scheduler.started(MACRO)
+    assert MACRO not in scheduler.due()
+
+
+def test_restore_discards_results_of_the_cancelled_refresh(app):
+    app.engine.positions.all.return_value = [mock.Mock(symbol="AAA")]
+    app.engine.refresh_order.return_value = ["AAA"]
+    app.start_refresh(FUNDAMENTALS)
+    app.refresh_results = {"AAA": (1.0, "AAA Corp", None, None, None)}
+    app.engine.restore.return_value = {"portfolio": 0}
+    with mock.patch.object(portfolio_tracker, "filedialog") as filedialog, \
+            mock.patch.object(portfolio_tracker, "messagebox") as messagebox:
+        filedialog.askopenfilename.return_value = "book.ptsnap"
+        messagebox.askyesno.return_value = True
+        app.restore_snapshot()
+    app.engine.restore.assert_called_once_with("book.ptsnap")
+    app.engine.refresh_engine.drain.assert_called()
+    assert (app.refresh_rows, app.refresh_results, app.refresh_job) == ({}, {}, None)
+
+    app.poll_refresh()  # The poll loop of the discarded run stops without applying anything
+    app.engine.apply_refresh.assert_not_called()